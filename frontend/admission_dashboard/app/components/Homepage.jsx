@@ -139,9 +139,16 @@ export default function Homepage() {
       credentials: "include",
     });
 
+    // Table uploads run as background jobs; wait for the job to finish
+    let succeeded = res.ok;
+    if (res.status === 202) {
+      const { jobId } = await res.json();
+      succeeded = await waitForJob(jobId);
+    }
+
     setLoading(false);
 
-    if (res.ok) {
+    if (succeeded) {
       alert("File uploaded successfully");
       window.location.reload();
     } else {
@@ -149,6 +156,26 @@ export default function Homepage() {
     }
   };
 
+  const waitForJob = async (jobId) => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      const res = await fetch(`http://localhost:8000/jobs/${jobId}`, {
+        credentials: "include",
+      });
+      if (!res.ok) {
+        return false;
+      }
+      const job = await res.json();
+      if (job.phase === "done") {
+        return true;
+      }
+      if (job.phase === "failed") {
+        console.error("Upload job failed:", job.error);
+        return false;
+      }
+    }
+  };
+
   const handleDrop = (event) => {
     event.preventDefault();
     const file = event.dataTransfer.files[0];
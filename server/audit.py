@@ -0,0 +1,96 @@
+# audit.py
+import logging
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from db import engine, logs_table
+
+logger = logging.getLogger(__name__)
+
+# Entries are written once this many are buffered, or every AUDIT_FLUSH_INTERVAL seconds
+AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", 100))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", 5))
+# While the database is unreachable, older entries beyond this are dropped
+AUDIT_MAX_BUFFER = int(os.environ.get("AUDIT_MAX_BUFFER", 10000))
+
+REQUIRED_FIELDS = ("file_name", "category", "uploaded_by", "remark", "ip_address")
+
+
+class AuditLog:
+    """
+    Buffers LOGS_TABLE entries in memory and inserts them in batches from a background thread.
+    stop() flushes whatever is left, and entries recorded after it are written immediately.
+    """
+
+    def __init__(self, batch_size: int = AUDIT_BATCH_SIZE, flush_interval: float = AUDIT_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+
+    def record(self, **entry):
+        """Queues one LOGS_TABLE row. upload_date defaults to now."""
+        missing = [field for field in REQUIRED_FIELDS if not entry.get(field)]
+        if missing:
+            raise ValueError(f"Missing required log fields: {missing}")
+        entry.setdefault("upload_date", datetime.now())
+
+        with self._condition:
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify()
+            stopped = self._stopped
+        if stopped:
+            self.flush()
+
+    def flush(self):
+        """Writes every buffered entry in one multi-row INSERT. Returns the number written."""
+        with self._flush_lock:
+            with self._condition:
+                entries, self._buffer = self._buffer, []
+            if not entries:
+                return 0
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(logs_table), entries)
+            except Exception:
+                logger.exception("Could not write %d audit log entries, keeping them for the next flush", len(entries))
+                with self._condition:
+                    self._buffer[:0] = entries
+                    del self._buffer[:-AUDIT_MAX_BUFFER]
+                return 0
+            return len(entries)
+
+    def start(self):
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread and flushes the remaining entries."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopped or len(self._buffer) >= self.batch_size, timeout=self.flush_interval
+                )
+                if self._stopped:
+                    return
+            self.flush()
+
+
+audit_log = AuditLog()
@@ -1,5 +1,7 @@
 # auth.py
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import jwt
 from passlib.context import CryptContext
@@ -9,7 +11,13 @@ SECRET_KEY = os.environ.get("SECRET_KEY", "your_secret_key_here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 # Token valid for 24 hours
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor: every +1 doubles the time per hash. Existing hashes are upgraded on login.
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+# Hashes computed at the same time; bcrypt releases the GIL, so up to one per core runs in parallel
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Creates a JWT access token with an expiration."""
@@ -26,3 +34,18 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     """Generates a hash for the given password."""
     return pwd_context.hash(password)
+
+
+async def verify_password_async(plain_password, hashed_password):
+    """
+    Verifies the password on the hashing pool, so the event loop keeps serving requests meanwhile.
+    Returns (valid, new_hash); new_hash is set when the stored hash uses an outdated cost factor.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password):
+    """get_password_hash on the hashing pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, get_password_hash, password)
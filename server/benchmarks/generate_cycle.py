@@ -0,0 +1,208 @@
+# generate_cycle.py
+"""
+Generates a synthetic admission cycle for scale testing: a MASTER_TABLE CSV plus one ITERATION_OFFER and
+one FEES_PAID CSV per iteration, in the column layouts POST /update/{table_name} expects.
+
+    python benchmarks/generate_cycle.py --applicants 1000000 --iterations 4 --out /tmp/cycle
+
+Applicants are simulated a chunk at a time and every chunk is appended to all the files, so memory
+depends on --chunk-size, not on --applicants. The same --seed always produces the same files.
+
+Each iteration:
+  - applicants never offered a seat get one with probability --offer-rate (a waitlist "WL" offer with
+    probability --waitlist-rate, otherwise a programme at one of the campuses)
+  - applicants who paid at least the admission fee keep their seat; with probability --offer-change-rate
+    their offer changes (an upgrade)
+  - everyone holding an offer appears in that iteration's fees file: both fees paid (--accept-rate),
+    only the admission fee (--upgrade-rate) or neither (the rest). Accepted applicants stay paid.
+
+With the flow.txt rules, admission-only payers become "upgrade" on a waitlist offer and "withdraw"
+otherwise, and accepted applicants whose offer changed become "accept & upgraded".
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+CAMPUSES = ["Pilani", "Goa", "Hyderabad"]
+PROGRAMMES = ["CS", "ECE", "EEE", "ENI", "Mechanical", "Chemical", "Civil", "Pharmacy", "Maths", "Physics", "Economics", "Biology"]
+WAITLIST_OFFER = "WL"  # status.WAITLIST_OFFER
+# Index i < len(PROGRAMME_OFFERS) is a programme at a campus; the last index is the waitlist
+PROGRAMME_OFFERS = [f"{campus} {programme}" for campus in CAMPUSES for programme in PROGRAMMES]
+OFFERS = np.array(PROGRAMME_OFFERS + [WAITLIST_OFFER])
+OFFER_CAMPUSES = np.array([campus for campus in CAMPUSES for _ in PROGRAMMES] + [""])
+WAITLIST = len(PROGRAMME_OFFERS)
+NO_OFFER = -1
+
+SCHOLARSHIPS = np.array([0, 6, 10, 18, 20])
+SCHOLARSHIP_WEIGHTS = np.array([0.40, 0.27, 0.20, 0.12, 0.01])
+ADMISSION_FEE = 50000
+TUITION_FEE = 250000
+
+# Fee outcomes: which fees an offered applicant has paid
+ACCEPT, UPGRADE, WITHDRAW = 0, 1, 2
+ADMISSION_PAID = np.array([1, 1, 0])
+TUITION_PAID = np.array([1, 0, 0])
+
+FIRST_NAMES = np.array([
+    "Aarav", "Aditi", "Akash", "Ananya", "Arjun", "Diya", "Ishaan", "Kavya", "Krishna", "Meera",
+    "Neha", "Nikhil", "Priya", "Rahul", "Riya", "Rohan", "Saanvi", "Sneha", "Varun", "Vivaan",
+])
+LAST_NAMES = np.array([
+    "Agarwal", "Bhat", "Das", "Gupta", "Iyer", "Jain", "Kapoor", "Kumar", "Mehta", "Nair",
+    "Patel", "Rao", "Reddy", "Shah", "Sharma", "Singh", "Srinivasan", "Verma",
+])
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+ITERATION_INTERVAL = timedelta(days=7)
+FEES_UPLOAD_DELAY = timedelta(days=6)  # The fees file of an iteration is uploaded this long after its offers
+
+
+def draw_offers(rng, count, waitlist_rate):
+    return np.where(rng.random(count) < waitlist_rate, WAITLIST, rng.integers(0, WAITLIST, count))
+
+
+def changed_offers(rng, offers):
+    """A different programme offer for each of `offers`; waitlisted applicants get any programme."""
+    shifted = (offers + rng.integers(1, WAITLIST, len(offers))) % WAITLIST
+    return np.where(offers == WAITLIST, rng.integers(0, WAITLIST, len(offers)), shifted)
+
+
+def simulate(rng, count, args):
+    """Returns (offers, outcomes), each of shape (iterations, count); NO_OFFER where not offered."""
+    offers = np.full((args.iterations, count), NO_OFFER)
+    outcomes = np.full((args.iterations, count), NO_OFFER)
+    ever_offered = np.zeros(count, dtype=bool)
+    mix = [args.accept_rate, args.upgrade_rate, 1 - args.accept_rate - args.upgrade_rate]
+
+    for iteration in range(args.iterations):
+        offer = np.full(count, NO_OFFER)
+        outcome = np.full(count, NO_OFFER)
+        if iteration:
+            previous_offer, previous_outcome = offers[iteration - 1], outcomes[iteration - 1]
+            holding = (previous_outcome == ACCEPT) | (previous_outcome == UPGRADE)
+            offer[holding] = previous_offer[holding]
+            change = holding & (rng.random(count) < args.offer_change_rate)
+            offer[change] = changed_offers(rng, previous_offer[change])
+            outcome[previous_outcome == ACCEPT] = ACCEPT
+
+        new = ~ever_offered & (rng.random(count) < args.offer_rate)
+        offer[new] = draw_offers(rng, int(new.sum()), args.waitlist_rate)
+        ever_offered |= new
+
+        undecided = (offer != NO_OFFER) & (outcome == NO_OFFER)
+        outcome[undecided] = rng.choice(3, int(undecided.sum()), p=mix)
+        offers[iteration], outcomes[iteration] = offer, outcome
+    return offers, outcomes
+
+
+def uploader(rng, offers):
+    """"<Campus> Admin" of the offered campus; waitlist offers come from a random campus."""
+    campuses = OFFER_CAMPUSES[offers]
+    waitlisted = offers == WAITLIST
+    campuses[waitlisted] = np.array(CAMPUSES)[rng.integers(0, len(CAMPUSES), int(waitlisted.sum()))]
+    return np.char.add(campuses.astype(str), " Admin")
+
+
+def write_chunk(rng, start, count, files, args, width):
+    app_nos = np.array([f"APP{number:0{width}d}" for number in range(start + 1, start + count + 1)])
+    pd.DataFrame({
+        "app_no": app_nos,
+        "name": np.char.add(np.char.add(rng.choice(FIRST_NAMES, count), " "), rng.choice(LAST_NAMES, count)),
+        "gender": rng.choice(["Female", "Male"], count),
+    }).to_csv(files["master"], header=start == 0, index=False)
+
+    offers, outcomes = simulate(rng, count, args)
+    for iteration in range(args.iterations):
+        offered = offers[iteration] != NO_OFFER
+        offer, outcome = offers[iteration][offered], outcomes[iteration][offered]
+        rows = int(offered.sum())
+        offer_date = args.start_date + iteration * ITERATION_INTERVAL
+        uploaded_by = uploader(rng, offer)
+
+        pd.DataFrame({
+            "app_no": app_nos[offered],
+            "itr_no": iteration + 1,
+            "offer": OFFERS[offer],
+            "scholarship": rng.choice(SCHOLARSHIPS, rows, p=SCHOLARSHIP_WEIGHTS),
+            "uploaded_by": uploaded_by,
+            "upload_datetime": offer_date.strftime(DATE_FORMAT),
+            "status": "",
+        }).to_csv(files["offers"][iteration], header=start == 0, index=False)
+
+        admission_paid, tuition_paid = ADMISSION_PAID[outcome], TUITION_PAID[outcome]
+        paid_dates = pd.Series(offer_date + pd.to_timedelta(rng.integers(0, 6 * 24 * 3600, rows), unit="s"))
+        paid_dates = paid_dates.dt.strftime(DATE_FORMAT).to_numpy()
+        fees_uploaded_at = (offer_date + FEES_UPLOAD_DELAY).strftime(DATE_FORMAT)
+        pd.DataFrame({
+            "app_no": app_nos[offered],
+            "admission_fees_amount": admission_paid * ADMISSION_FEE,
+            "admission_fees_status": admission_paid,
+            "admission_fees_paid_date": paid_dates,
+            "admission_fees_uploaded_by": uploaded_by,
+            "admission_fees_upload_date_time": fees_uploaded_at,
+            "tution_fees_amount": tuition_paid * TUITION_FEE,
+            "tution_fees_status": tuition_paid,
+            "tution_fees_paid_date": paid_dates,
+            "tution_fees_uploaded_by": uploaded_by,
+            "tution_fees_upload_date_time": fees_uploaded_at,
+        }).to_csv(files["fees"][iteration], header=start == 0, index=False)
+
+    return offers != NO_OFFER, outcomes
+
+
+def main(args):
+    if args.accept_rate + args.upgrade_rate > 1:
+        raise SystemExit("--accept-rate + --upgrade-rate must be at most 1")
+    os.makedirs(args.out, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+    width = max(5, len(str(args.applicants)))
+
+    paths = {
+        "master": os.path.join(args.out, "MasterFile.csv"),
+        "offers": [os.path.join(args.out, f"Iteration Offer {i}.csv") for i in range(1, args.iterations + 1)],
+        "fees": [os.path.join(args.out, f"Fees_Paid_Iteration_{i}.csv") for i in range(1, args.iterations + 1)],
+    }
+    files = {
+        "master": open(paths["master"], "w", newline=""),
+        "offers": [open(path, "w", newline="") for path in paths["offers"]],
+        "fees": [open(path, "w", newline="") for path in paths["fees"]],
+    }
+    offered_rows = np.zeros(args.iterations, dtype=int)
+    outcome_counts = np.zeros((args.iterations, 3), dtype=int)
+    try:
+        for start in range(0, args.applicants, args.chunk_size):
+            count = min(args.chunk_size, args.applicants - start)
+            offered, outcomes = write_chunk(rng, start, count, files, args, width)
+            offered_rows += offered.sum(axis=1)
+            for outcome in (ACCEPT, UPGRADE, WITHDRAW):
+                outcome_counts[:, outcome] += (outcomes == outcome).sum(axis=1)
+    finally:
+        for fileobj in [files["master"], *files["offers"], *files["fees"]]:
+            fileobj.close()
+
+    print(f"{paths['master']}: {args.applicants} applicants")
+    for iteration in range(args.iterations):
+        accepted, upgrading, withdrawn = outcome_counts[iteration]
+        print(
+            f"iteration {iteration + 1}: {offered_rows[iteration]} offers, fees paid in full {accepted}, "
+            f"admission only {upgrading}, none {withdrawn}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--applicants", type=int, default=35000)
+    parser.add_argument("--iterations", type=int, default=2)
+    parser.add_argument("--out", required=True, help="Directory the CSVs are written to")
+    parser.add_argument("--offer-rate", type=float, default=0.15, help="Chance a waiting applicant gets an offer per iteration")
+    parser.add_argument("--waitlist-rate", type=float, default=0.1, help="Share of new offers that are waitlist (WL)")
+    parser.add_argument("--offer-change-rate", type=float, default=0.3, help="Chance a held offer changes next iteration")
+    parser.add_argument("--accept-rate", type=float, default=0.1, help="Share of offered applicants paying both fees")
+    parser.add_argument("--upgrade-rate", type=float, default=0.8, help="Share paying only the admission fee")
+    parser.add_argument("--start-date", type=datetime.fromisoformat, default=datetime(2025, 1, 2, 9, 0))
+    parser.add_argument("--chunk-size", type=int, default=100000, help="Applicants simulated per chunk")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
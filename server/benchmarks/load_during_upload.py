@@ -0,0 +1,94 @@
+# load_during_upload.py
+"""
+Measures dashboard read latency while a CSV upload is running.
+
+Runs concurrent readers against a live server, first on their own (baseline) and then while an upload
+is being processed, and prints latency percentiles for both phases. With the async handlers the
+"upload" phase should stay close to the baseline.
+
+    python benchmarks/load_during_upload.py --token <jwt> --table ITERATION_OFFER --file "Iteration Offer 2.csv"
+
+The token is the `token` cookie set by /api/login for an admin user.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+READ_PATHS = ["/api/stats", "/api/validate-token", "/api/iterations?iteration=1", "/api/iteration-count"]
+
+
+async def reader(client, stop, latencies):
+    """Requests READ_PATHS round-robin until `stop` is set, recording each latency in milliseconds."""
+    index = 0
+    while not stop.is_set():
+        path = READ_PATHS[index % len(READ_PATHS)]
+        start = time.perf_counter()
+        response = await client.get(path)
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        index += 1
+
+
+async def run_readers(client, concurrency, stop):
+    latencies = []
+    tasks = [asyncio.create_task(reader(client, stop, latencies)) for _ in range(concurrency)]
+    await stop.wait()
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+async def upload_and_wait(client, table, file_path, stop):
+    """Uploads the file and polls its job until it is done or failed, then stops the readers."""
+    try:
+        with open(file_path, "rb") as fileobj:
+            response = await client.post(f"/update/{table}", files={"file": (file_path, fileobj, "text/csv")})
+        response.raise_for_status()
+        job_id = response.json().get("jobId")
+        while job_id:
+            job = (await client.get(f"/jobs/{job_id}")).json()
+            if job["phase"] in ("done", "failed"):
+                print(f"upload {job['phase']}: {job['rowsIngested']} rows, error={job['error']}")
+                break
+            await asyncio.sleep(0.5)
+    finally:
+        stop.set()
+
+
+def summary(name, latencies):
+    if not latencies:
+        return f"{name:>8}: no requests"
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1] if len(ordered) >= 20 else ordered[-1]
+    return (
+        f"{name:>8}: {len(ordered)} requests, p50 {statistics.median(ordered):.1f} ms, "
+        f"p95 {p95:.1f} ms, max {ordered[-1]:.1f} ms"
+    )
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.base_url, cookies={"token": args.token}, timeout=120) as client:
+        stop = asyncio.Event()
+        asyncio.get_running_loop().call_later(args.baseline_seconds, stop.set)
+        baseline = await run_readers(client, args.concurrency, stop)
+
+        stop = asyncio.Event()
+        readers = asyncio.create_task(run_readers(client, args.concurrency, stop))
+        await upload_and_wait(client, args.table, args.file, stop)
+        during_upload = await readers
+
+    print(summary("baseline", baseline))
+    print(summary("upload", during_upload))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", required=True, help="JWT of an admin user")
+    parser.add_argument("--table", default="ITERATION_OFFER")
+    parser.add_argument("--file", required=True, help="CSV to upload while reading")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--baseline-seconds", type=float, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,55 @@
+# password_hashing.py
+"""
+Measures login throughput (bcrypt verifications per second) as the hashing pool grows.
+
+Each run pushes --logins concurrent verify_password_async calls through a pool of N threads, the way
+/api/login does, for N = 1, 2, 4, ... up to the number of cores. Throughput should scale with N until
+N reaches the core count.
+
+    python benchmarks/password_hashing.py --rounds 12 --logins 64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth  # noqa: E402
+
+
+async def run(workers: int, logins: int, hashed_password: str):
+    auth.hash_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[auth.verify_password_async("correct horse battery staple", hashed_password) for _ in range(logins)]
+    )
+    elapsed = time.perf_counter() - start
+    auth.hash_executor.shutdown()
+    assert all(valid for valid, _ in results)
+    return elapsed
+
+
+def main(args):
+    auth.pwd_context.update(bcrypt__rounds=args.rounds)
+    hashed_password = auth.get_password_hash("correct horse battery staple")
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, cores, *[2 ** i for i in range(1, 8) if 2 ** i <= max(cores, args.max_workers)]})
+
+    print(f"bcrypt rounds={args.rounds}, {args.logins} logins per run, {cores} cores")
+    baseline = None
+    for workers in worker_counts:
+        elapsed = asyncio.run(run(workers, args.logins, hashed_password))
+        throughput = args.logins / elapsed
+        baseline = baseline or throughput
+        print(f"{workers:>4} workers: {throughput:8.1f} logins/s  ({throughput / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=auth.BCRYPT_ROUNDS, help="bcrypt cost factor")
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--max-workers", type=int, default=0, help="Also try pools larger than the core count")
+    main(parser.parse_args())
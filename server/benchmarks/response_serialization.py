@@ -0,0 +1,110 @@
+# response_serialization.py
+"""
+Compares JSON response serialization paths on an ITERATION_OFFER-sized result set.
+
+Fills an in-memory SQLite copy of ITERATION_OFFER, fetches it once, then times building the response
+body with the old path (RowMapping -> jsonable_encoder -> JSONResponse) against FastJSONResponse with
+row records and with the column-oriented payload.
+
+    python benchmarks/response_serialization.py --rows 20000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import Column, DateTime, Integer, MetaData, SmallInteger, String, Table, create_engine, insert, select
+from starlette.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization  # noqa: E402
+from serialization import FastJSONResponse, columns, records  # noqa: E402
+
+STATUSES = ["accept", "accept & upgraded", "upgrade", "withdraw"]
+
+# Same columns as db.iteration_offer_table; importing db would connect to MySQL
+iteration_offer_table = Table(
+    "ITERATION_OFFER",
+    MetaData(),
+    Column("app_no", String(255), primary_key=True),
+    Column("itr_no", Integer, primary_key=True),
+    Column("offer", String(255), nullable=False),
+    Column("scholarship", Integer),
+    Column("uploaded_by", String(255), nullable=False),
+    Column("upload_datetime", DateTime),
+    Column("status", String(255)),
+    Column("status_code", SmallInteger, nullable=False),
+)
+
+
+def load_rows(count):
+    engine = create_engine("sqlite://")
+    iteration_offer_table.create(engine)
+    start = datetime(2025, 1, 2, 9, 0)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(iteration_offer_table),
+            [
+                {
+                    "app_no": f"APP{index:06d}",
+                    "itr_no": 1 + index % 3,
+                    "offer": f"Offer_{index % 40}",
+                    "scholarship": 20,
+                    "status": STATUSES[index % len(STATUSES)],
+                    "status_code": 1 + index % len(STATUSES),
+                    "uploaded_by": "Pilani Admin",
+                    "upload_datetime": start + timedelta(seconds=index),
+                }
+                for index in range(count)
+            ],
+        )
+        result = connection.execute(select(iteration_offer_table))
+        names = list(result.keys())
+        rows = result.all()
+    return names, rows
+
+
+def jsonable_encoder_path(names, rows):
+    return JSONResponse(jsonable_encoder([row._mapping for row in rows])).body
+
+
+def records_path(names, rows):
+    return FastJSONResponse(records(names, rows)).body
+
+
+def columns_path(names, rows):
+    return FastJSONResponse(columns(names, rows)).body
+
+
+def best_of(function, names, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = function(names, rows)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), len(body)
+
+
+def main(args):
+    names, rows = load_rows(args.rows)
+    encoder = "orjson" if serialization.orjson is not None else "json (orjson not installed)"
+    print(f"{len(rows)} rows, {len(names)} columns, encoder: {encoder}")
+    baseline = None
+    for name, function in [
+        ("jsonable_encoder", jsonable_encoder_path),
+        ("records", records_path),
+        ("columns", columns_path),
+    ]:
+        elapsed, size = best_of(function, names, rows, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{name:>16}: {elapsed:8.1f} ms  {size / 1024:8.0f} KiB  {baseline / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per path; the best is reported")
+    main(parser.parse_args())
@@ -0,0 +1,253 @@
+# upload_flow.py
+"""
+Benchmarks the admission flow of flow.txt and the hot read paths on the bundled CSV fixtures.
+
+Replays master -> offer 1 -> fees 1 -> offer 2 -> fees 2 through ingest_csv (the code behind
+POST /update/{table_name}), then times get_stats and get_student, once per --scales entry. Fixtures are
+scaled by copying every applicant under a suffixed app_no, so 10x means ten times the applicants.
+
+For every phase it reports wall time, SQL statements executed, rows (or requests) per second and
+peak RSS, the process high-water mark so far.
+
+    python benchmarks/upload_flow.py --scales 1 10 100 --save benchmarks/baseline.json
+    python benchmarks/upload_flow.py --scales 1 10 --compare benchmarks/baseline.json
+    python benchmarks/upload_flow.py --data-dir /tmp/cycle   # files from generate_cycle.py, all iterations
+
+Runs on a throwaway SQLite database unless --database-url points at a MySQL database. Every scale
+drops and recreates all tables, so never point it at a database you want to keep.
+With --compare, exits with status 1 when a phase is slower than the baseline by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.dirname(SERVER_DIR)
+sys.path.insert(0, SERVER_DIR)
+
+# (phase, table, fixture) in the order of flow.txt
+FLOW = [
+    ("master", "MASTER_TABLE", "MasterFile.csv"),
+    ("offer 1", "ITERATION_OFFER", "Iteration Offer 1 (1).csv"),
+    ("fees 1", "FEES_PAID", "Fees_Paid_Iteration_1 (3).csv"),
+    ("offer 2", "ITERATION_OFFER", "Iteration Offer 2.csv"),
+    ("fees 2", "FEES_PAID", "Fees_Paid_Iteration_2.csv"),
+]
+SCALE_CHUNK_SIZE = 50000  # Fixture rows held in memory while writing a scaled copy
+MIN_REGRESSION_SECONDS = 0.05  # Slowdowns smaller than this are timer noise, whatever the ratio
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def scale_fixture(source, target, scale):
+    """
+    Writes `scale` copies of every row of `source` to `target`, chunk by chunk; copy k gets app_no
+    "<app_no>-k". MasterFile.csv predates the gender column, so a missing gender is filled in.
+    """
+    with open(target, "w", newline="") as out:
+        for index, chunk in enumerate(pd.read_csv(source, chunksize=SCALE_CHUNK_SIZE, dtype=str)):
+            if "name" in chunk.columns and "gender" not in chunk.columns:
+                chunk["gender"] = np.where(chunk.index % 2 == 0, "Female", "Male")
+            for copy in range(scale):
+                scaled = chunk if copy == 0 else chunk.assign(app_no=chunk["app_no"] + f"-{copy}")
+                scaled.to_csv(out, header=index == 0 and copy == 0, index=False)
+
+
+class StatementCounter:
+    """Counts the SQL statements sent through the given engines (an executemany counts once)."""
+
+    def __init__(self, *engines):
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def phase_result(name, items, seconds, statements):
+    return {
+        "phase": name,
+        "items": items,
+        "seconds": round(seconds, 3),
+        "statements": statements,
+        "itemsPerSecond": round(items / seconds, 1) if seconds else None,
+        "peakRssMb": peak_rss_mb(),
+    }
+
+
+def measure(name, counter, run):
+    """Runs `run()`, which returns the number of rows it handled, and returns the phase's metrics."""
+    statements = counter.count
+    start = time.perf_counter()
+    items = run()
+    return phase_result(name, items, time.perf_counter() - start, counter.count - statements)
+
+
+def sample(values, count):
+    """`count` values spread evenly over `values`."""
+    step = max(len(values) // count, 1)
+    return list(values[::step][:count])
+
+
+async def query_phases(counter, app_nos, names, repeat):
+    async def run_stats():
+        async with AsyncSessionLocal() as session:
+            for _ in range(repeat):
+                await stats_routes.compute_stats(session)
+        return repeat
+
+    async def run_students(queries):
+        async with AsyncSessionLocal() as session:
+            for query in queries:
+                await stats_routes.get_student(query=query, limit=SEARCH_LIMIT, session=session)
+        return len(queries)
+
+    results = []
+    for name, run in [
+        ("get_stats", run_stats),
+        ("get_student app_no", lambda: run_students(app_nos)),
+        ("get_student name", lambda: run_students(names)),
+    ]:
+        statements = counter.count
+        start = time.perf_counter()
+        items = await run()
+        results.append(phase_result(name, items, time.perf_counter() - start, counter.count - statements))
+    await async_engine.dispose()
+    return results
+
+
+def generated_flow(directory):
+    """The flow of a generate_cycle.py output directory: master, then offers and fees of each iteration."""
+    flow = [("master", "MASTER_TABLE", "MasterFile.csv")]
+    iteration = 1
+    while os.path.exists(os.path.join(directory, f"Iteration Offer {iteration}.csv")):
+        flow.append((f"offer {iteration}", "ITERATION_OFFER", f"Iteration Offer {iteration}.csv"))
+        flow.append((f"fees {iteration}", "FEES_PAID", f"Fees_Paid_Iteration_{iteration}.csv"))
+        iteration += 1
+    return flow
+
+
+def run_scale(scale, counter, workdir, args):
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    invalidate_name_index()
+    invalidate_stats()
+
+    fixture_dir = args.data_dir or FIXTURE_DIR
+    results = []
+    for phase, table_name, fixture in generated_flow(args.data_dir) if args.data_dir else FLOW:
+        path = os.path.join(workdir, f"{scale}x {fixture}")
+        scale_fixture(os.path.join(fixture_dir, fixture), path, scale)
+        if phase.startswith("offer") and phase != "offer 1" and engine.dialect.name == "mysql":
+            # ITERATION_DATE.date has one-second resolution on MySQL; keep the two iterations apart
+            time.sleep(1)
+
+        def ingest():
+            with engine.begin() as connection, open(path, "rb") as fileobj:
+                return ingest_csv(connection, metadata.tables[table_name], fileobj, args.chunk_size)["rows"]
+
+        results.append(measure(phase, counter, ingest))
+        os.remove(path)
+
+    master = pd.read_csv(os.path.join(fixture_dir, "MasterFile.csv"), dtype=str, nrows=SCALE_CHUNK_SIZE)
+    app_nos = sample(master["app_no"], args.queries)
+    names = [name.split()[0] for name in sample(master["name"], args.queries)]
+    results += asyncio.run(query_phases(counter, app_nos, names, args.queries))
+    return results
+
+
+def print_results(scale, results):
+    print(f"\n{scale}x")
+    print(f"{'phase':>20} {'items':>9} {'seconds':>9} {'statements':>11} {'items/s':>10} {'peak RSS':>10}")
+    for result in results:
+        print(
+            f"{result['phase']:>20} {result['items']:>9} {result['seconds']:>9.3f} {result['statements']:>11} "
+            f"{result['itemsPerSecond'] or 0:>10.1f} {result['peakRssMb']:>8.1f}MB"
+        )
+
+
+def compare(report, baseline, tolerance):
+    """Prints each phase's time and statement count against the baseline; returns the regressed phases."""
+    regressions = []
+    print(f"\nAgainst baseline from {baseline['createdAt']} ({baseline['database']})")
+    for scale, results in report["scales"].items():
+        previous = {result["phase"]: result for result in baseline["scales"].get(scale, [])}
+        for result in results:
+            before = previous.get(result["phase"])
+            if before is None:
+                continue
+            ratio = result["seconds"] / before["seconds"] if before["seconds"] else 1.0
+            slower = ratio > 1 + tolerance and result["seconds"] - before["seconds"] > MIN_REGRESSION_SECONDS
+            regressed = slower or result["statements"] > before["statements"]
+            if regressed:
+                regressions.append(f"{scale}x {result['phase']}")
+            print(
+                f"{scale + 'x':>5} {result['phase']:>20}: {ratio:5.2f}x time, "
+                f"{result['statements'] - before['statements']:+d} statements{'  REGRESSION' if regressed else ''}"
+            )
+    return regressions
+
+
+def main(args):
+    counter = StatementCounter(engine, async_engine.sync_engine)
+    report = {"database": engine.dialect.name, "createdAt": datetime.now().isoformat(timespec="seconds"), "scales": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in args.scales:
+            results = run_scale(scale, counter, workdir, args)
+            report["scales"][str(scale)] = results
+            print_results(scale, results)
+
+    if args.save:
+        with open(args.save, "w") as out:
+            json.dump(report, out, indent=2)
+        print(f"\nSaved {args.save}")
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(report, json.load(baseline), args.tolerance)
+        if regressions:
+            print(f"\nRegressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--data-dir", help="Replay the CSVs written by generate_cycle.py instead of the fixtures")
+    parser.add_argument("--database-url", help="SQLAlchemy URL of a scratch MySQL database (default: temporary SQLite)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Upload chunk size, as on POST /update")
+    parser.add_argument("--queries", type=int, default=50, help="Requests per query phase")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with a JSON file written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a phase regresses")
+    args = parser.parse_args()
+
+    # db reads the URLs when it is imported
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+    else:
+        database_path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+        os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{database_path}"
+
+    from sqlalchemy import event
+    from db import AsyncSessionLocal, async_engine, engine, metadata
+    from ingest import ingest_csv
+    from routes import stats_routes
+    from search import SEARCH_LIMIT, invalidate_name_index
+    from stats_cache import invalidate_stats
+
+    main(args)
@@ -0,0 +1,44 @@
+# bulk.py
+import os
+
+import pandas as pd
+from sqlalchemy import DateTime
+
+from db import upsert
+
+# Number of CSV rows sent per multi-row INSERT statement.
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 1000))
+
+
+def dataframe_records(df: pd.DataFrame):
+    """Converts a DataFrame to a list of dicts with NaN values replaced by None."""
+    return df.astype(object).where(pd.notna(df), None).to_dict("records")
+
+
+def bulk_upsert(connection, table_obj, df: pd.DataFrame, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Upserts every row of the DataFrame into the given table.
+
+    Rows are sent in chunks of `chunk_size` as a single multi-row
+    INSERT ... ON DUPLICATE KEY UPDATE per chunk, instead of one statement per row.
+    Columns that are not part of the table are ignored.
+
+    Returns the number of rows sent to the database.
+    """
+    columns = [col.name for col in table_obj.columns if col.name in df.columns]
+    primary_keys = {col.name for col in table_obj.primary_key}
+    update_columns = [name for name in columns if name not in primary_keys] or columns
+    # SQLite (the benchmark database) only takes datetime objects; MySQL is sent the CSV's strings
+    # unchanged and converts them itself
+    datetime_columns = [name for name in columns if isinstance(table_obj.c[name].type, DateTime)]
+    if datetime_columns and connection.dialect.name == "sqlite":
+        df = df.assign(**{name: pd.to_datetime(df[name]) for name in datetime_columns})
+
+    rows_written = 0
+    for start in range(0, len(df), chunk_size):
+        records = dataframe_records(df.iloc[start:start + chunk_size][columns])
+        stmt = upsert(table_obj).values(records)
+        stmt = stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in update_columns})
+        connection.execute(stmt)
+        rows_written += len(records)
+    return rows_written
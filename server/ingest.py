@@ -0,0 +1,174 @@
+# ingest.py
+import time
+from collections import Counter
+from datetime import datetime
+
+import pandas as pd
+from fastapi import HTTPException
+
+from bulk import UPLOAD_CHUNK_SIZE, bulk_upsert
+from db import iteration_date_table, upsert
+from latest_offer import refresh_latest_offers
+from status import (
+    ACCEPT_UPGRADED,
+    classify_fees,
+    fetch_changed_paid_offers,
+    fetch_offer_history,
+    get_latest_iteration,
+    is_upgraded,
+    status_codes,
+    write_statuses,
+)
+
+
+def upload_columns(table_obj):
+    """The columns a CSV uploaded to `table_obj` must have; status_code is derived from status."""
+    return [name for name in table_obj.columns.keys() if name != "status_code"]
+
+
+def check_columns(columns, required_columns):
+    required_columns = set(required_columns)
+    if not required_columns.issubset(set(columns)):
+        raise HTTPException(status_code=400, detail=f"CSV must contain columns: {required_columns}")
+
+
+def validate_csv_header(fileobj, required_columns):
+    """Checks the header row of a seekable CSV file object against `required_columns`, then rewinds it."""
+    try:
+        columns = pd.read_csv(fileobj, nrows=0).columns
+    except pd.errors.EmptyDataError:
+        raise HTTPException(status_code=400, detail="The CSV file is empty.")
+    finally:
+        fileobj.seek(0)
+    check_columns(columns, required_columns)
+
+
+def read_csv_chunks(fileobj, chunk_size: int = UPLOAD_CHUNK_SIZE, required_columns=()):
+    """
+    Yields DataFrames of at most `chunk_size` rows parsed from a CSV file object,
+    so only one chunk is held in memory at a time.
+    The header is validated against `required_columns` when the first chunk is read.
+    """
+    for index, chunk in enumerate(pd.read_csv(fileobj, chunksize=chunk_size)):
+        if index == 0:
+            check_columns(chunk.columns, required_columns)
+        yield chunk
+
+
+def ingest_csv(
+    connection,
+    table_obj,
+    fileobj,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    recompute: str = "incremental",
+    progress=None,
+    state=None,
+):
+    """
+    Streams a CSV upload into `table_obj` chunk by chunk: each chunk is upserted as soon as it
+    is parsed, then the ITERATION_OFFER / FEES_PAID status rules are applied to that chunk.
+
+    If given, `progress(phase, rows_ingested, rows_classified)` is called after every chunk.
+    With an IterationState (see iteration_state.py) the rules read applicant history from it instead
+    of LATEST_OFFER, only statuses that change are written, and every write is applied to it.
+
+    Returns a summary with the rows written, rows re-evaluated, status counts and elapsed time.
+    """
+    start_time = time.perf_counter()
+    upper_table = table_obj.name.upper()
+    rows_written = 0
+    rows_reevaluated = 0
+    status_counts = Counter()
+    latest_iteration = None
+
+    # status_code is derived from status, not part of the CSV
+    required_columns = upload_columns(table_obj)
+
+    for index, df in enumerate(read_csv_chunks(fileobj, chunk_size, required_columns)):
+        if "status_code" in table_obj.c:
+            df["status_code"] = status_codes(df["status"])
+        rows_written += bulk_upsert(connection, table_obj, df, chunk_size)
+
+        if upper_table == "ITERATION_OFFER":
+            refresh_latest_offers(connection, df["app_no"])
+            if state is not None:
+                state.apply_offers(df)
+            if index == 0:
+                current_time = datetime.now()
+                stmt = upsert(iteration_date_table).values(
+                    iteration=int(df["itr_no"].iloc[0]), date=current_time
+                )
+                stmt = stmt.on_duplicate_key_update(date=current_time)
+                connection.execute(stmt)
+                latest_iteration = get_latest_iteration(connection)
+
+            if latest_iteration is not None and recompute == "incremental":
+                # Only students in this chunk whose offer changed can become "accept & upgraded"
+                if state is not None:
+                    candidates = state.changed_paid_offers(df["app_no"])
+                else:
+                    candidates = fetch_changed_paid_offers(connection, df["app_no"])
+                rows_reevaluated += len(candidates)
+                status_counts[ACCEPT_UPGRADED] += write_upgraded(
+                    connection, candidates, latest_iteration, chunk_size, state
+                )
+
+        elif upper_table == "FEES_PAID":
+            if index == 0:
+                latest_iteration = get_latest_iteration(connection)
+
+            if latest_iteration is not None:
+                if state is not None:
+                    history = state.history(df["app_no"])
+                else:
+                    history = fetch_offer_history(connection, df["app_no"])
+                statuses = classify_fees(df, history, latest_iteration)
+                write_changed_statuses(connection, statuses, latest_iteration, chunk_size, state)
+                rows_reevaluated += len(statuses)
+                status_counts.update(statuses.value_counts().to_dict())
+            if state is not None:
+                state.apply_fees(df)
+
+        elif upper_table == "WITHDRAWS" and state is not None:
+            state.record_withdraws(df["app_no"])
+
+        if progress is not None:
+            progress("ingesting", rows_written, rows_reevaluated)
+
+    if upper_table == "ITERATION_OFFER" and latest_iteration is not None and recompute == "full":
+        if progress is not None:
+            progress("classifying", rows_written, rows_reevaluated)
+        # Re-check every fee payer once, after the whole file is in
+        candidates = state.changed_paid_offers() if state is not None else fetch_changed_paid_offers(connection)
+        rows_reevaluated += len(candidates)
+        status_counts[ACCEPT_UPGRADED] += write_upgraded(connection, candidates, latest_iteration, chunk_size, state)
+
+    return {
+        "rows": rows_written,
+        "rowsReevaluated": rows_reevaluated,
+        "statusCounts": {key: int(count) for key, count in status_counts.items()},
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def write_upgraded(
+    connection, candidates: pd.DataFrame, latest_iteration, chunk_size: int = UPLOAD_CHUNK_SIZE, state=None
+):
+    """Marks the upgraded candidates as "accept & upgraded" and returns how many there were."""
+    upgraded = candidates[is_upgraded(candidates)]
+    write_changed_statuses(
+        connection, pd.Series(ACCEPT_UPGRADED, index=upgraded.index), latest_iteration, chunk_size, state
+    )
+    return len(upgraded)
+
+
+def write_changed_statuses(connection, statuses: pd.Series, iteration, chunk_size: int = UPLOAD_CHUNK_SIZE, state=None):
+    """write_statuses(), skipping the statuses the IterationState shows are already stored when most of them are."""
+    if state is not None:
+        changed = state.needs_write(statuses, iteration)
+        state.apply_statuses(statuses, iteration)
+        # Only when most are unchanged (e.g. a fees file uploaded again): a CASE of a new length misses
+        # the compiled statement caches, which costs more than rewriting a few unchanged rows
+        if changed.sum() * 2 < len(statuses):
+            statuses = statuses[changed]
+    write_statuses(connection, statuses, iteration, chunk_size)
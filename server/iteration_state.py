@@ -0,0 +1,449 @@
+# iteration_state.py
+import json
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+
+from db import engine, fees_paid_table, latest_offer_table, withdraws_table
+from status import OTHER_STATUS_CODE, STATUS_CODES, WITHDRAW
+
+logger = logging.getLogger(__name__)
+
+# Keep applicant state in memory for the upload jobs (see IterationState); off falls back to LATEST_OFFER queries
+ITERATION_STATE = os.environ.get("ITERATION_STATE", "true").lower() in ("1", "true", "yes")
+# Snapshot directory read on startup, so a restart does not reload every applicant from the database
+ITERATION_STATE_DIR = os.environ.get(
+    "ITERATION_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "iteration_state")
+)
+STATE_LOAD_BATCH = int(os.environ.get("STATE_LOAD_BATCH", 50000))  # Rows fetched per batch when loading
+
+SNAPSHOT_VERSION = 1
+NONE = -1  # Dictionary code of a missing offer or status
+
+# name -> (dtype, value of an applicant without it)
+ARRAYS = {
+    "itr_no": (np.int32, 0),
+    "offer": (np.int32, NONE),
+    "status": (np.int32, NONE),
+    "prev_itr_no": (np.int32, 0),
+    "prev_offer": (np.int32, NONE),
+    "prev_status": (np.int32, NONE),
+    "has_fees": (np.bool_, False),  # Has a FEES_PAID row
+    "fees_paid": (np.bool_, False),  # Admission and tuition fees both paid
+    "withdrawn": (np.bool_, False),  # Listed in WITHDRAWS
+}
+HISTORY_COLUMNS = ["itr_no", "offer", "status", "prev_offer", "prev_status", "prev_status_code"]
+
+
+class Dictionary:
+    """Maps the distinct strings of a column to small integer codes; NONE stands for NULL."""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, values) -> np.ndarray:
+        values = pd.Series(values, dtype=object)
+        for value in values.dropna().unique():
+            if value not in self.codes:
+                self.codes[value] = len(self.values)
+                self.values.append(value)
+        return values.map(self.codes).fillna(NONE).to_numpy(dtype=np.int32)
+
+    def decode(self, codes) -> np.ndarray:
+        # NONE (-1) picks the trailing None
+        return np.array(self.values + [None], dtype=object)[codes]
+
+
+class IterationState:
+    """
+    In-memory copy of everything the status rules read: per applicant, the LATEST_OFFER projection
+    (latest and previous iteration with their offer and status), whether both fees are paid and
+    whether they are in WITHDRAWS.
+
+    Applicants get integer ids indexing one numpy array per field; offers and statuses are
+    dictionary-encoded. Uploads apply their rows as deltas, so classifying a FEES_PAID chunk or finding
+    the "accept & upgraded" candidates of an ITERATION_OFFER chunk costs no query, and only statuses
+    that actually change are written back. The rules themselves stay in status.py: history() and
+    changed_paid_offers() return the same frames as fetch_offer_history() and fetch_changed_paid_offers().
+
+    Snapshots are a directory of .npy files, opened memory-mapped (copy-on-write) on the next start.
+    The state is trusted while its fingerprint() equals the database's; writes from other processes
+    that leave the row counts and status sums unchanged are not noticed, so run a single server process
+    or set ITERATION_STATE=false.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()  # Held by an upload for its whole transaction
+        self.loaded = False
+        self.reset()
+
+    def reset(self):
+        self.app_nos = []
+        self.ids = {}
+        self.offers = Dictionary()
+        self.statuses = Dictionary()
+        self.size = 0
+        for name, (dtype, missing) in ARRAYS.items():
+            setattr(self, name, np.full(0, missing, dtype=dtype))
+
+    def invalidate(self):
+        """Forgets the state; the next upload reloads it from the database."""
+        with self.lock:
+            self.loaded = False
+
+    def _reserve(self, count: int):
+        capacity = len(self.itr_no)
+        if self.size + count <= capacity:
+            return
+        capacity = max(self.size + count, capacity * 2, 1024)
+        for name, (dtype, missing) in ARRAYS.items():
+            grown = np.full(capacity, missing, dtype=dtype)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
+
+    def _assign(self, app_nos) -> np.ndarray:
+        """Ids of the given app_nos, adding the ones not seen before."""
+        # Plain dict lookups: Series.map(dict) would copy the whole id table on every call
+        app_nos = list(app_nos)
+        new = [app_no for app_no in dict.fromkeys(app_nos) if app_no not in self.ids]
+        self._reserve(len(new))
+        for app_no in new:
+            self.ids[app_no] = self.size
+            self.app_nos.append(app_no)
+            self.size += 1
+        return np.array([self.ids[app_no] for app_no in app_nos], dtype=np.int64)
+
+    def _lookup(self, app_nos) -> np.ndarray:
+        """Ids of the given app_nos, -1 for unknown ones."""
+        return np.array([self.ids.get(app_no, -1) for app_no in app_nos], dtype=np.int64)
+
+    def _status_code_lookup(self) -> np.ndarray:
+        """status.STATUS_CODES by dictionary code; NONE maps to the trailing OTHER_STATUS_CODE."""
+        return np.array([STATUS_CODES.get(value, OTHER_STATUS_CODE) for value in self.statuses.values] + [OTHER_STATUS_CODE])
+
+    def fingerprint(self):
+        """database_fingerprint() computed from the state."""
+        itr_no, prev_itr_no = self.itr_no[:self.size], self.prev_itr_no[:self.size]
+        codes = self._status_code_lookup()
+        latest, previous = itr_no > 0, prev_itr_no > 0
+        return [
+            int(latest.sum()),
+            int(itr_no.sum()),
+            int(codes[self.status[:self.size][latest]].sum()),
+            int(codes[self.prev_status[:self.size][previous]].sum()),
+            int(self.has_fees[:self.size].sum()),
+            int(self.withdrawn[:self.size].sum()),
+        ]
+
+    # Loading
+
+    def load(self, connection, app_nos=None):
+        """
+        Reads LATEST_OFFER, FEES_PAID and WITHDRAWS into a fresh state, STATE_LOAD_BATCH rows at a time.
+        Restricted to the given app_nos when provided.
+        """
+        self.reset()
+
+        def restrict(stmt, table):
+            if app_nos is None:
+                return stmt
+            return stmt.where(table.c.app_no.in_(list(dict.fromkeys(app_nos))))
+
+        offers = connection.execution_options(yield_per=STATE_LOAD_BATCH).execute(
+            restrict(
+                select(
+                    latest_offer_table.c.app_no,
+                    latest_offer_table.c.itr_no,
+                    latest_offer_table.c.offer,
+                    latest_offer_table.c.status,
+                    latest_offer_table.c.prev_itr_no,
+                    latest_offer_table.c.prev_offer,
+                    latest_offer_table.c.prev_status,
+                ),
+                latest_offer_table,
+            )
+        )
+        for rows in offers.partitions():
+            batch = pd.DataFrame(rows, columns=list(offers.keys()))
+            ids = self._assign(batch["app_no"])
+            self.itr_no[ids] = batch["itr_no"]
+            self.offer[ids] = self.offers.encode(batch["offer"])
+            self.status[ids] = self.statuses.encode(batch["status"])
+            self.prev_itr_no[ids] = batch["prev_itr_no"].fillna(0)
+            self.prev_offer[ids] = self.offers.encode(batch["prev_offer"])
+            self.prev_status[ids] = self.statuses.encode(batch["prev_status"])
+
+        fees = connection.execution_options(yield_per=STATE_LOAD_BATCH).execute(
+            restrict(
+                select(fees_paid_table.c.app_no, fees_paid_table.c.admission_fees_status, fees_paid_table.c.tution_fees_status),
+                fees_paid_table,
+            )
+        )
+        for rows in fees.partitions():
+            self.apply_fees(pd.DataFrame(rows, columns=list(fees.keys())))
+
+        withdraws = connection.execution_options(yield_per=STATE_LOAD_BATCH).execute(
+            restrict(select(withdraws_table.c.app_no), withdraws_table)
+        )
+        for rows in withdraws.partitions():
+            self.record_withdraws([app_no for app_no, in rows])
+        self.loaded = True
+
+    def sync(self):
+        """Loads the state from the database unless it is loaded and its fingerprint still matches."""
+        with self.lock, engine.connect() as connection:
+            if self.loaded and self.fingerprint() == database_fingerprint(connection):
+                return
+            self.load(connection)
+            logger.info("Loaded iteration state of %d applicants from the database", self.size)
+
+    @contextmanager
+    def updating(self):
+        """
+        Yields the up-to-date state to an upload, or None when ITERATION_STATE is off. Open the upload's
+        transaction inside this block: the state is checkpointed after the commit, and dropped
+        (reloaded by the next upload) if anything fails.
+        """
+        if not ITERATION_STATE:
+            yield None
+            return
+        with self.lock:
+            self.sync()
+            try:
+                yield self
+            except BaseException:
+                self.invalidate()
+                raise
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Checks the state against the database and saves a snapshot; a state that drifted is dropped instead."""
+        with self.lock:
+            with engine.connect() as connection:
+                current = database_fingerprint(connection)
+            if current != self.fingerprint():
+                logger.warning("Iteration state no longer matches the database; it is reloaded by the next upload")
+                self.invalidate()
+                return
+            try:
+                self.save_snapshot()
+            except OSError:
+                logger.warning("Could not save the iteration state snapshot", exc_info=True)
+
+    def warm_start(self):
+        """Called on startup: uses the snapshot if it matches the database, otherwise loads the database."""
+        if not ITERATION_STATE:
+            return
+        with self.lock:
+            try:
+                if self.load_snapshot(ITERATION_STATE_DIR):
+                    with engine.connect() as connection:
+                        if self.fingerprint() == database_fingerprint(connection):
+                            logger.info("Loaded iteration state of %d applicants from %s", self.size, ITERATION_STATE_DIR)
+                            return
+                self.sync()
+                self.checkpoint()
+            except Exception:
+                # Runs on a worker nobody waits for; the first upload retries the load
+                logger.exception("Could not load the iteration state")
+                self.invalidate()
+
+    # Snapshots
+
+    def save_snapshot(self, directory: str = ITERATION_STATE_DIR):
+        """Writes the state to `directory` (one .npy per array, meta.json for the rest), swapped in once complete."""
+        staging, previous = f"{directory}.tmp", f"{directory}.old"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        np.save(os.path.join(staging, "app_no.npy"), np.array(self.app_nos, dtype=str))
+        for name in ARRAYS:
+            np.save(os.path.join(staging, f"{name}.npy"), getattr(self, name)[:self.size])
+        with open(os.path.join(staging, "meta.json"), "w") as meta:
+            json.dump(
+                {
+                    "version": SNAPSHOT_VERSION,
+                    "size": self.size,
+                    "offers": self.offers.values,
+                    "statuses": self.statuses.values,
+                },
+                meta,
+            )
+
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(directory):
+            os.rename(directory, previous)
+        os.rename(staging, directory)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    def load_snapshot(self, directory: str = ITERATION_STATE_DIR) -> bool:
+        """
+        Replaces the state with the snapshot in `directory`, if there is one. The arrays stay
+        memory-mapped copy-on-write: pages are read on first use and deltas never touch the file.
+        """
+        try:
+            with open(os.path.join(directory, "meta.json")) as meta:
+                meta = json.load(meta)
+        except (OSError, ValueError):
+            return False
+        if meta.get("version") != SNAPSHOT_VERSION:
+            return False
+
+        self.reset()
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="c"))
+        self.app_nos = np.load(os.path.join(directory, "app_no.npy")).tolist()
+        self.ids = {app_no: index for index, app_no in enumerate(self.app_nos)}
+        self.size = meta["size"]
+        self.offers = Dictionary(meta["offers"])
+        self.statuses = Dictionary(meta["statuses"])
+        self.loaded = True
+        return True
+
+    # Reads, in the shape of the status.py queries
+
+    def _history_frame(self, ids) -> pd.DataFrame:
+        prev_status_code = self._status_code_lookup()[self.prev_status[ids]].astype(float)
+        prev_status_code[self.prev_itr_no[ids] == 0] = np.nan
+        return pd.DataFrame(
+            {
+                "itr_no": self.itr_no[ids],
+                "offer": self.offers.decode(self.offer[ids]),
+                "status": self.statuses.decode(self.status[ids]),
+                "prev_offer": self.offers.decode(self.prev_offer[ids]),
+                "prev_status": self.statuses.decode(self.prev_status[ids]),
+                "prev_status_code": prev_status_code,
+            },
+            index=pd.Index([self.app_nos[i] for i in ids], dtype=object, name="app_no"),
+            columns=HISTORY_COLUMNS,
+        )
+
+    def history(self, app_nos) -> pd.DataFrame:
+        """status.fetch_offer_history() without the query."""
+        ids = pd.unique(self._lookup(app_nos))
+        ids = ids[ids >= 0]
+        return self._history_frame(ids[self.itr_no[ids] > 0])
+
+    def changed_paid_offers(self, app_nos=None) -> pd.DataFrame:
+        """status.fetch_changed_paid_offers() without the query."""
+        if app_nos is None:
+            ids = np.arange(self.size)
+        else:
+            ids = pd.unique(self._lookup(app_nos))
+            ids = ids[ids >= 0]
+        changed = (self.prev_itr_no[ids] > 0) & (self.offer[ids] != self.prev_offer[ids]) & self.fees_paid[ids]
+        return self._history_frame(ids[changed])
+
+    def needs_write(self, statuses: pd.Series, iteration) -> np.ndarray:
+        """
+        Which app_no -> status entries would change ITERATION_OFFER rows of `iteration`. Rows older than
+        the previous iteration are not tracked, so those are always written.
+        """
+        ids = self._lookup(statuses.index)
+        codes = self.statuses.encode(statuses.to_numpy())
+        known = ids >= 0
+        ids, codes = ids[known], codes[known]
+        latest, previous = self.itr_no[ids], self.prev_itr_no[ids]
+        needed = np.zeros(len(statuses), dtype=bool)
+        needed[known] = (
+            ((latest == iteration) & (self.status[ids] != codes))
+            | ((previous == iteration) & (self.prev_status[ids] != codes))
+            | ((previous > 0) & (iteration < previous))
+        )
+        return needed
+
+    # Deltas, applied in the same order as the writes they mirror
+
+    def apply_offers(self, offers: pd.DataFrame):
+        """Mirrors refresh_latest_offers() after ITERATION_OFFER rows were upserted."""
+        offers = offers.drop_duplicates(["app_no", "itr_no"], keep="last")
+        for iteration, rows in offers.groupby("itr_no", sort=True):
+            iteration = int(iteration)
+            ids = self._assign(rows["app_no"])
+            offer = self.offers.encode(rows["offer"])
+            status = self.statuses.encode(rows["status"])
+            latest, previous = self.itr_no[ids], self.prev_itr_no[ids]
+
+            newer = iteration > latest
+            shifted = ids[newer]
+            self.prev_itr_no[shifted] = self.itr_no[shifted]
+            self.prev_offer[shifted] = self.offer[shifted]
+            self.prev_status[shifted] = self.status[shifted]
+            current = newer | (iteration == latest)
+            self.itr_no[ids[current]] = iteration
+            self.offer[ids[current]] = offer[current]
+            self.status[ids[current]] = status[current]
+            # An older iteration becomes the previous one if it is at least as recent as the one there
+            older = (iteration < latest) & (iteration >= previous)
+            self.prev_itr_no[ids[older]] = iteration
+            self.prev_offer[ids[older]] = offer[older]
+            self.prev_status[ids[older]] = status[older]
+
+    def apply_statuses(self, statuses: pd.Series, iteration):
+        """Mirrors status.write_statuses()."""
+        ids = self._lookup(statuses.index)
+        codes = self.statuses.encode(statuses.to_numpy())
+        known = ids >= 0
+        ids, codes = ids[known], codes[known]
+        latest = self.itr_no[ids] == iteration
+        self.status[ids[latest]] = codes[latest]
+        previous = self.prev_itr_no[ids] == iteration
+        self.prev_status[ids[previous]] = codes[previous]
+
+    def apply_fees(self, fees: pd.DataFrame):
+        """Mirrors FEES_PAID rows being upserted."""
+        fees = fees.drop_duplicates("app_no", keep="last")
+        paid = (fees["admission_fees_status"].fillna(0) != 0) & (fees["tution_fees_status"].fillna(0) != 0)
+        ids = self._assign(fees["app_no"])
+        self.has_fees[ids] = True
+        self.fees_paid[ids] = paid.to_numpy()
+
+    def record_withdraws(self, app_nos):
+        """Mirrors WITHDRAWS rows being inserted."""
+        self.withdrawn[self._assign(app_nos)] = True
+
+    def apply_withdrawals(self, app_nos):
+        """
+        Mirrors status.withdraw_applicants(). Never waits for a running upload: while one holds the state,
+        the state is dropped and reloaded by the next upload.
+        """
+        if not self.lock.acquire(blocking=False):
+            self.loaded = False
+            return
+        try:
+            if not self.loaded:
+                return
+            ids = self._lookup(app_nos)
+            ids = ids[ids >= 0]
+            ids = ids[self.itr_no[ids] > 0]  # Applicants without offers are left out, as in the database
+            self.status[ids] = self.statuses.encode([WITHDRAW])[0]
+            self.withdrawn[ids] = True
+        finally:
+            self.lock.release()
+
+
+def database_fingerprint(connection):
+    """
+    Row counts and iteration / status sums of the tables the state mirrors: cheap to compute, and changed
+    by almost any write the state did not see.
+    """
+    offers = connection.execute(
+        select(
+            func.count(),
+            func.sum(latest_offer_table.c.itr_no),
+            func.sum(latest_offer_table.c.status_code),
+            func.sum(latest_offer_table.c.prev_status_code),
+        )
+    ).one()
+    fees = connection.execute(select(func.count()).select_from(fees_paid_table)).scalar()
+    withdraws = connection.execute(select(func.count()).select_from(withdraws_table)).scalar()
+    return [int(value or 0) for value in (*offers, fees, withdraws)]
+
+
+iteration_state = IterationState()
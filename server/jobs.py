@@ -0,0 +1,229 @@
+# jobs.py
+import logging
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.dialects.mysql import insert
+
+from audit import audit_log
+from db import engine, metadata, upload_jobs_table
+from ingest import ingest_csv, upload_columns, validate_csv_header
+from iteration_state import iteration_state
+from request_metrics import track
+from search import invalidate_name_index
+from stats_cache import invalidate_stats
+
+logger = logging.getLogger(__name__)
+
+# Uploads are copied here until their job finishes, so queued work survives a restart
+UPLOAD_SPOOL_DIR = os.environ.get(
+    "UPLOAD_SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "upload_spool")
+)
+
+ACTIVE_PHASES = ("queued", "ingesting", "classifying")
+
+# One worker, so uploads commit in the order they were queued: an ITERATION_OFFER upload must be
+# committed before the FEES_PAID upload that follows it reads the latest iteration
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload")
+
+
+def submit_upload(upload, table_name: str, chunk_size: int, recompute: str, uploaded_by: str, ip_address: str):
+    """
+    Spools the uploaded file to disk, records an UPLOAD_JOBS row and queues it. Returns the job id.
+    A file without the table's columns is rejected here with a 400, before any job exists.
+    """
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    file_path = os.path.join(UPLOAD_SPOOL_DIR, f"{job_id}.csv")
+    with open(file_path, "w+b") as spool:
+        shutil.copyfileobj(upload.file, spool)
+        spool.seek(0)
+        try:
+            validate_csv_header(spool, upload_columns(metadata.tables[table_name]))
+        except HTTPException:
+            spool.close()
+            os.remove(file_path)
+            raise
+
+    with engine.begin() as connection:
+        connection.execute(
+            insert(upload_jobs_table).values(
+                job_id=job_id,
+                table_name=table_name,
+                file_name=upload.filename,
+                file_path=file_path,
+                chunk_size=chunk_size,
+                recompute=recompute,
+                uploaded_by=uploaded_by,
+                ip_address=ip_address,
+                phase="queued",
+                rows_ingested=0,
+                rows_classified=0,
+                bytes_read=0,
+                bytes_total=os.path.getsize(file_path),
+                created_at=datetime.now(),
+            )
+        )
+    executor.submit(run_job, job_id)
+    return job_id
+
+
+def update_job(job_id: str, **values):
+    """Writes job progress in its own transaction so pollers see it while the upload is still running."""
+    with engine.begin() as connection:
+        connection.execute(
+            update(upload_jobs_table).where(upload_jobs_table.c.job_id == job_id).values(**values)
+        )
+
+
+def get_job(job_id: str):
+    with engine.connect() as connection:
+        return connection.execute(
+            select(upload_jobs_table).where(upload_jobs_table.c.job_id == job_id)
+        ).mappings().fetchone()
+
+
+def run_job(job_id: str):
+    """Runs a queued upload: ingests the spooled CSV in one transaction, then queues its LOGS_TABLE entry."""
+    job = get_job(job_id)
+    if job is None or job["phase"] not in ACTIVE_PHASES:
+        return
+
+    # Recorded in /metrics like a request, so the statements an upload issues are visible
+    with track("JOB", f"/update/{job['table_name']}") as stats:
+        stats.status = process_job(job_id, job)
+
+
+def process_job(job_id: str, job) -> str:
+    """Ingests the job's file and records the outcome; returns the final phase, done or failed."""
+    try:
+        table_obj = metadata.tables[job["table_name"]]
+        update_job(job_id, phase="ingesting", started_at=datetime.now(), rows_ingested=0, rows_classified=0)
+
+        with open(job["file_path"], "rb") as fileobj:
+
+            def progress(phase, rows_ingested, rows_classified):
+                # A failed progress write must not abort the upload itself
+                try:
+                    update_job(
+                        job_id,
+                        phase=phase,
+                        rows_ingested=rows_ingested,
+                        rows_classified=rows_classified,
+                        bytes_read=fileobj.tell(),
+                    )
+                except Exception:
+                    logger.warning("Could not record progress for upload job %s", job_id, exc_info=True)
+
+            # The state is checkpointed after the commit, or dropped if the upload fails
+            with iteration_state.updating() as state, engine.begin() as connection:
+                summary = ingest_csv(
+                    connection, table_obj, fileobj, job["chunk_size"], job["recompute"], progress, state
+                )
+            invalidate_stats()
+            if table_obj.name == "MASTER_TABLE":
+                invalidate_name_index()
+
+        audit_upload(job, "Upload completed", summary)
+        update_job(
+            job_id,
+            phase="done",
+            rows_ingested=summary["rows"],
+            rows_classified=summary["rowsReevaluated"],
+            bytes_read=job["bytes_total"],
+            duration_ms=round(summary["seconds"] * 1000),
+            status_counts=summary["statusCounts"],
+            finished_at=datetime.now(),
+        )
+        return "done"
+    except Exception as e:
+        logger.exception("Upload job %s failed", job_id)
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        update_job(job_id, phase="failed", error=str(detail)[:1024], finished_at=datetime.now())
+        audit_upload(job, f"Upload failed: {detail}"[:255])
+        return "failed"
+    finally:
+        if os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+
+
+def audit_upload(job, remark: str, summary=None):
+    """Queues the LOGS_TABLE entry of a finished upload job, with its ingest summary if it succeeded."""
+    summary = summary or {}
+    audit_log.record(
+        file_name=job["file_name"],
+        category=job["table_name"].upper(),
+        uploaded_by=job["uploaded_by"],
+        remark=remark,
+        ip_address=job["ip_address"],
+        job_id=job["job_id"],
+        rows_ingested=summary.get("rows"),
+        rows_reevaluated=summary.get("rowsReevaluated"),
+        duration_ms=round(summary["seconds"] * 1000) if "seconds" in summary else None,
+        status_counts=summary.get("statusCounts"),
+    )
+
+
+def recover_jobs():
+    """
+    Called on startup. Uploads that were queued or running when the server stopped were rolled back,
+    so they are queued again from their spooled file, or marked failed if the file is gone.
+    """
+    with engine.connect() as connection:
+        jobs = connection.execute(
+            select(upload_jobs_table.c.job_id, upload_jobs_table.c.file_path)
+            .where(upload_jobs_table.c.phase.in_(ACTIVE_PHASES))
+            .order_by(upload_jobs_table.c.created_at)
+        ).fetchall()
+
+    for job_id, file_path in jobs:
+        if os.path.exists(file_path):
+            update_job(job_id, phase="queued")
+            executor.submit(run_job, job_id)
+        else:
+            update_job(
+                job_id,
+                phase="failed",
+                error="Server restarted and the uploaded file is no longer available.",
+                finished_at=datetime.now(),
+            )
+    if jobs:
+        logger.info("Recovered %d upload jobs", len(jobs))
+
+
+def job_progress(job):
+    """
+    Builds the progress payload for an UPLOAD_JOBS row, including an ETA based on bytes processed.
+    Once the job is done it also carries the ingest summary: rowsPerSecond and statusCounts.
+    """
+    eta_seconds = None
+    if job["phase"] in ACTIVE_PHASES and job["started_at"] and job["bytes_read"]:
+        elapsed = (datetime.now() - job["started_at"]).total_seconds()
+        remaining = max(job["bytes_total"] - job["bytes_read"], 0)
+        eta_seconds = round(elapsed * remaining / job["bytes_read"], 1)
+    rows_per_second = None
+    if job["phase"] == "done" and job["duration_ms"]:
+        rows_per_second = round(job["rows_ingested"] * 1000 / job["duration_ms"], 1)
+
+    return {
+        "jobId": job["job_id"],
+        "table": job["table_name"],
+        "fileName": job["file_name"],
+        "phase": job["phase"],
+        "rowsIngested": job["rows_ingested"],
+        "rowsClassified": job["rows_classified"],
+        "bytesRead": job["bytes_read"],
+        "bytesTotal": job["bytes_total"],
+        "etaSeconds": eta_seconds,
+        "rowsPerSecond": rows_per_second,
+        "statusCounts": job["status_counts"],
+        "error": job["error"],
+        "createdAt": job["created_at"],
+        "startedAt": job["started_at"],
+        "finishedAt": job["finished_at"],
+    }
@@ -0,0 +1,95 @@
+# latest_offer.py
+import logging
+
+from sqlalchemy import and_, delete, func, select
+
+from db import engine, iteration_offer_table, latest_offer_table, upsert
+
+logger = logging.getLogger(__name__)
+
+
+def ranked_offers(app_nos=None):
+    """
+    Subquery over ITERATION_OFFER numbering each app_no's iterations from the latest (rn = 1) backwards.
+    Restricted to the given app_nos when provided.
+    """
+    stmt = select(
+        iteration_offer_table.c.app_no,
+        iteration_offer_table.c.itr_no,
+        iteration_offer_table.c.offer,
+        iteration_offer_table.c.status,
+        iteration_offer_table.c.status_code,
+        func.row_number()
+        .over(
+            partition_by=iteration_offer_table.c.app_no,
+            order_by=iteration_offer_table.c.itr_no.desc(),
+        )
+        .label("rn"),
+    )
+    if app_nos is not None:
+        stmt = stmt.where(iteration_offer_table.c.app_no.in_(list(dict.fromkeys(app_nos))))
+    return stmt.subquery()
+
+
+def refresh_latest_offers(connection, app_nos=None):
+    """
+    Recomputes the LATEST_OFFER rows of the given app_nos (all applicants if None) from ITERATION_OFFER
+    with one INSERT ... SELECT ... ON DUPLICATE KEY UPDATE.
+    Must be called in the same transaction as every write to ITERATION_OFFER offers or statuses.
+    """
+    ranked = ranked_offers(app_nos)
+    latest = ranked.alias("latest")
+    previous = ranked.alias("previous")
+    projection = (
+        select(
+            latest.c.app_no,
+            latest.c.itr_no,
+            latest.c.offer,
+            latest.c.status,
+            latest.c.status_code,
+            previous.c.itr_no,
+            previous.c.offer,
+            previous.c.status,
+            previous.c.status_code,
+        )
+        .select_from(latest)
+        .outerjoin(previous, and_(previous.c.app_no == latest.c.app_no, previous.c.rn == 2))
+        .where(latest.c.rn == 1)
+    )
+    columns = [
+        "app_no",
+        "itr_no",
+        "offer",
+        "status",
+        "status_code",
+        "prev_itr_no",
+        "prev_offer",
+        "prev_status",
+        "prev_status_code",
+    ]
+    stmt = upsert(latest_offer_table).from_select(columns, projection)
+    stmt = stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in columns[1:]})
+    connection.execute(stmt)
+
+
+def rebuild_latest_offers(connection):
+    """Recreates LATEST_OFFER from scratch."""
+    connection.execute(delete(latest_offer_table))
+    refresh_latest_offers(connection)
+
+
+def ensure_latest_offers():
+    """Builds LATEST_OFFER on first start after it was added, when it is still empty but offers exist."""
+    with engine.begin() as connection:
+        has_projection = connection.execute(select(latest_offer_table.c.app_no).limit(1)).first()
+        has_offers = connection.execute(select(iteration_offer_table.c.app_no).limit(1)).first()
+        if has_offers and not has_projection:
+            logger.info("Building LATEST_OFFER from ITERATION_OFFER")
+            refresh_latest_offers(connection)
+
+
+if __name__ == "__main__":
+    # Rebuild command: python latest_offer.py
+    with engine.begin() as connection:
+        rebuild_latest_offers(connection)
+    print("LATEST_OFFER rebuilt.")
@@ -3,13 +3,25 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 
-from routes import auth_routes, data_routes,stats_routes
+import audit
+import auth
+import jobs
+from db import async_engine, engine
+from iteration_state import iteration_state
+import latest_offer
+import migrations
+import request_metrics
+from routes import auth_routes, data_routes, export_routes, metrics_routes, stats_routes
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Per-route wall time, DB time and statement counts, served at /metrics (login or METRICS_ALLOWED_IPS); slow requests are logged
+request_metrics.instrument(engine, async_engine.sync_engine)
+app.add_middleware(request_metrics.RequestMetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://172.17.48.18:3000","http://localhost:8000","http://172.17.49.204:3000","http://172.17.49.204:8000", "http://172.17.48.18:3000","http://172.17.48.18:8000"],
@@ -22,6 +34,61 @@ app.add_middleware(
 app.include_router(auth_routes.router, prefix="/api")
 app.include_router(data_routes.router)
 app.include_router(stats_routes.router, prefix="/api") 
+app.include_router(metrics_routes.router, prefix="/api")
+app.include_router(metrics_routes.prometheus_router)
+app.include_router(export_routes.router, prefix="/api")
+
+
+@app.on_event("startup")
+def apply_migrations():
+    # Indexes and columns added after a table was first created
+    migrations.run_migrations()
+
+
+@app.on_event("startup")
+def build_latest_offers():
+    # One-off backfill of LATEST_OFFER for databases created before it existed
+    latest_offer.ensure_latest_offers()
+
+
+@app.on_event("startup")
+def start_audit_log():
+    audit.audit_log.start()
+
+
+@app.on_event("startup")
+def warm_start_iteration_state():
+    # On an upload worker so the API is up meanwhile; uploads wait for the state
+    jobs.executor.submit(iteration_state.warm_start)
+
+
+@app.on_event("startup")
+def resume_upload_jobs():
+    # Re-queue uploads that were still pending when the server last stopped
+    jobs.recover_jobs()
+
+
+@app.on_event("shutdown")
+def stop_upload_workers():
+    # Unfinished jobs stay queued in UPLOAD_JOBS and are resumed on the next start
+    jobs.executor.shutdown(wait=False, cancel_futures=True)
+
+
+@app.on_event("shutdown")
+def flush_audit_log():
+    # Jobs still finishing after this write their entry directly
+    audit.audit_log.stop()
+
+
+@app.on_event("shutdown")
+def stop_password_hashing():
+    auth.hash_executor.shutdown(wait=False, cancel_futures=True)
+
+
+@app.on_event("shutdown")
+async def close_database_pool():
+    await async_engine.dispose()
+
 
 if __name__ == "__main__":
     import uvicorn
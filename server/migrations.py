@@ -0,0 +1,191 @@
+# migrations.py
+import logging
+import sys
+from datetime import datetime
+
+from sqlalchemy import JSON, Index, Integer, MetaData, SmallInteger, String, Table, inspect, select, text, update
+
+from db import (
+    engine,
+    iteration_date_table,
+    iteration_offer_table,
+    latest_offer_table,
+    logs_table,
+    schema_migrations_table,
+)
+from status import ACCEPT_CODES, status_code_case
+
+logger = logging.getLogger(__name__)
+
+
+# metadata.create_all() only creates missing tables, so anything added to an existing table
+# (indexes, columns) goes through a numbered migration here. Every step must be safe to re-run:
+# on a fresh database create_all has already built the final schema from db.py.
+
+
+def index_names(connection, table_name):
+    return {index["name"] for index in inspect(connection).get_indexes(table_name)}
+
+
+def create_index(connection, table_name, index_name, *columns):
+    """Creates the index unless the table already has one with that name."""
+    if index_name in index_names(connection, table_name):
+        return
+    table = Table(table_name, MetaData(), autoload_with=connection)
+    Index(index_name, *[table.c[column] for column in columns]).create(connection)
+    logger.info("Created index %s on %s%s", index_name, table_name, columns)
+
+
+def add_column(connection, table_name, column_name, ddl_type, suffix=""):
+    """Adds the column unless the table already has it. `suffix` holds NULL/DEFAULT clauses."""
+    if column_name in {column["name"] for column in inspect(connection).get_columns(table_name)}:
+        return
+    preparer = connection.dialect.identifier_preparer
+    connection.execute(
+        text(
+            f"ALTER TABLE {preparer.quote(table_name)} ADD COLUMN {preparer.quote(column_name)} "
+            f"{ddl_type.compile(dialect=connection.dialect)} {suffix}"
+        )
+    )
+    logger.info("Added column %s.%s", table_name, column_name)
+
+
+def add_hot_predicate_indexes(connection):
+    # ITERATION_OFFER's itr_no lookups get their index from add_status_codes
+    create_index(connection, "ITERATION_DATE", "ix_iteration_date_date", "date")
+    create_index(connection, "LOGS_TABLE", "ix_logs_table_upload_date", "upload_date")
+
+
+def add_status_codes(connection):
+    add_column(connection, "ITERATION_OFFER", "status_code", SmallInteger(), "NOT NULL DEFAULT 0")
+    add_column(connection, "LATEST_OFFER", "status_code", SmallInteger(), "NOT NULL DEFAULT 0")
+    add_column(connection, "LATEST_OFFER", "prev_status_code", SmallInteger())
+    connection.execute(
+        update(iteration_offer_table).values(status_code=status_code_case(iteration_offer_table.c.status))
+    )
+    connection.execute(
+        update(latest_offer_table).values(status_code=status_code_case(latest_offer_table.c.status))
+    )
+    connection.execute(
+        update(latest_offer_table)
+        .where(latest_offer_table.c.prev_itr_no.is_not(None))
+        .values(prev_status_code=status_code_case(latest_offer_table.c.prev_status))
+    )
+    # (itr_no, status_code) also serves itr_no-only lookups through its leftmost column
+    create_index(connection, "ITERATION_OFFER", "ix_iteration_offer_itr_no_status_code", "itr_no", "status_code")
+    create_index(connection, "LATEST_OFFER", "ix_latest_offer_status_code", "status_code")
+
+
+def add_structured_log_columns(connection):
+    add_column(connection, "LOGS_TABLE", "job_id", String(36))
+    add_column(connection, "LOGS_TABLE", "rows_ingested", Integer())
+    add_column(connection, "LOGS_TABLE", "rows_reevaluated", Integer())
+    add_column(connection, "LOGS_TABLE", "duration_ms", Integer())
+    add_column(connection, "LOGS_TABLE", "status_counts", JSON())
+
+
+def add_upload_job_summary_columns(connection):
+    add_column(connection, "UPLOAD_JOBS", "duration_ms", Integer())
+    add_column(connection, "UPLOAD_JOBS", "status_counts", JSON())
+
+
+# (version, name, function), applied in order. Append only: never renumber or edit an applied step.
+MIGRATIONS = [
+    (1, "add_hot_predicate_indexes", add_hot_predicate_indexes),
+    (2, "add_status_codes", add_status_codes),
+    (3, "add_structured_log_columns", add_structured_log_columns),
+    (4, "add_upload_job_summary_columns", add_upload_job_summary_columns),
+]
+
+
+def applied_versions():
+    with engine.connect() as connection:
+        return set(connection.execute(select(schema_migrations_table.c.version)).scalars())
+
+
+def run_migrations():
+    """Applies every migration not yet recorded in SCHEMA_MIGRATIONS. Returns the versions applied."""
+    done = applied_versions()
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        # MySQL commits DDL implicitly, so a failed step is simply re-run on the next start
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(
+                schema_migrations_table.insert().values(version=version, name=name, applied_at=datetime.now())
+            )
+        logger.info("Applied migration %d_%s", version, name)
+        applied.append(version)
+    return applied
+
+
+# Hot queries and the index each one is expected to use
+INDEX_CHECKS = [
+    (
+        "/api/iterations",
+        select(
+            iteration_offer_table.c.app_no,
+            iteration_offer_table.c.itr_no,
+            iteration_offer_table.c.offer,
+            iteration_offer_table.c.status,
+        ).where(iteration_offer_table.c.itr_no == 1),
+        "ix_iteration_offer_itr_no_status_code",
+    ),
+    (
+        "accepted students (/api/stats)",
+        select(latest_offer_table.c.app_no).where(latest_offer_table.c.status_code.in_(ACCEPT_CODES)),
+        "ix_latest_offer_status_code",
+    ),
+    (
+        "latest iteration (/api/stats, uploads)",
+        select(iteration_date_table.c.iteration).order_by(iteration_date_table.c.date.desc()).limit(1),
+        "ix_iteration_date_date",
+    ),
+    (
+        "recent uploads",
+        select(logs_table).order_by(logs_table.c.upload_date.desc()).limit(50),
+        "ix_logs_table_upload_date",
+    ),
+]
+
+
+def explain(connection, stmt):
+    """Returns the query plan of `stmt` as a list of strings, one per plan row."""
+    sql = str(stmt.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == "sqlite":
+        return [row.detail for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    return [
+        f"{row['table']}: key={row['key']} type={row['type']} rows={row['rows']} extra={row['Extra']}"
+        for row in connection.execute(text(f"EXPLAIN {sql}")).mappings()
+    ]
+
+
+def check_index_usage():
+    """
+    Runs EXPLAIN on every query in INDEX_CHECKS and returns (label, index, used, plan) for each.
+    On nearly empty tables the optimizer may prefer a scan, so run this against realistic data.
+    """
+    results = []
+    with engine.connect() as connection:
+        for label, stmt, index_name in INDEX_CHECKS:
+            plan = explain(connection, stmt)
+            used = any(index_name in line for line in plan)
+            results.append((label, index_name, used, plan))
+    return results
+
+
+if __name__ == "__main__":
+    # python migrations.py            apply pending migrations
+    # python migrations.py --explain  also check that the hot queries use their indexes
+    logging.basicConfig(level=logging.INFO)
+    run_migrations()
+    if "--explain" in sys.argv:
+        ok = True
+        for label, index_name, used, plan in check_index_usage():
+            print(f"[{'ok' if used else 'MISSING'}] {label} -> {index_name}")
+            for line in plan:
+                print(f"    {line}")
+            ok = ok and used
+        sys.exit(0 if ok else 1)
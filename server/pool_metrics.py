@@ -0,0 +1,67 @@
+# pool_metrics.py
+import os
+import threading
+from collections import deque
+
+from sqlalchemy import event
+
+# Number of recent checkout waits kept for the percentile
+POOL_WAIT_SAMPLES = int(os.environ.get("POOL_WAIT_SAMPLES", 1000))
+
+
+class PoolMetrics:
+    """
+    Tracks how busy a connection pool is: connections checked out against its capacity
+    (pool_size + max_overflow), the peak since start, and how long callers waited for a connection.
+    """
+
+    def __init__(self, pool, capacity: int):
+        self.pool = pool
+        self.capacity = capacity
+        self.checkouts = 0
+        self.timeouts = 0
+        self.peak_checked_out = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waits = deque(maxlen=POOL_WAIT_SAMPLES)
+        self._lock = threading.Lock()
+        event.listen(pool, "checkout", self._on_checkout)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        checked_out = self.pool.checkedout()
+        with self._lock:
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+
+    def record_wait(self, seconds: float):
+        """Records the time a caller spent waiting for a connection."""
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.waits.append(seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(self.waits)
+            checked_out = self.pool.checkedout()
+            return {
+                "poolSize": self.pool.size(),
+                "checkedOut": checked_out,
+                "overflow": max(self.pool.overflow(), 0),
+                "capacity": self.capacity,
+                "saturation": round(checked_out / self.capacity, 3) if self.capacity else None,
+                "peakCheckedOut": self.peak_checked_out,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "waitMs": {
+                    "avg": round(1000 * self.wait_total / self.wait_count, 3) if self.wait_count else 0.0,
+                    "p95": round(1000 * waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+                    "max": round(1000 * self.wait_max, 3),
+                },
+            }
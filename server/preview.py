@@ -0,0 +1,221 @@
+# preview.py
+import os
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Integer, select
+
+from db import engine
+from ingest import read_csv_chunks, upload_columns, validate_csv_header
+from iteration_state import IterationState
+from status import ACCEPT_UPGRADED, classify_fees, get_latest_iteration, is_upgraded
+
+# Rows compared per round trip; larger than an upload chunk since nothing is written
+PREVIEW_CHUNK_SIZE = int(os.environ.get("PREVIEW_CHUNK_SIZE", 10000))
+PREVIEW_SAMPLE_ROWS = int(os.environ.get("PREVIEW_SAMPLE_ROWS", 20))  # Example rows reported per kind of change
+
+NULL = "\x1fNULL"  # Canonical form of NULL; not a NUL byte, which numpy strings drop
+HASH = "_hash"
+
+
+def canonical(df: pd.DataFrame, table_obj, names) -> pd.DataFrame:
+    """
+    The given columns as strings that are equal exactly when the stored values would be: dates at the
+    second, whole numbers without a decimal point (a CSV integer column with gaps is read as float).
+    """
+    values = {}
+    for name in names:
+        column_type = table_obj.c[name].type
+        column = df[name]
+        if isinstance(column_type, DateTime):
+            column = pd.to_datetime(column, errors="coerce").dt.strftime("%Y-%m-%d %H:%M:%S")
+        elif isinstance(column_type, Integer):
+            numbers = pd.to_numeric(column, errors="coerce")
+            column = numbers.astype("Int64") if (numbers.dropna() % 1 == 0).all() else numbers.astype("Float64")
+        values[name] = column.astype("string").fillna(NULL)
+    return pd.DataFrame(values, index=df.index)
+
+
+def row_hashes(df: pd.DataFrame):
+    """One 64-bit hash per row of a canonical frame."""
+    if df.columns.empty:
+        return pd.Series(0, index=df.index, dtype="uint64")
+    return pd.util.hash_pandas_object(df, index=False)
+
+
+def fetch_current(connection, table_obj, primary_keys, names, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The stored rows whose primary key occurs in `df`, with one IN query per key column. With a composite
+    key that can return extra rows; the join in diff_chunk drops them.
+    """
+    stmt = select(*(table_obj.c[name] for name in primary_keys + names))
+    for name in primary_keys:
+        stmt = stmt.where(table_obj.c[name].in_(pd.unique(df[name].dropna()).tolist()))
+    rows = connection.execute(stmt).fetchall()
+    return pd.DataFrame(rows, columns=primary_keys + names)
+
+
+def superseded_rows(fileobj, table_obj, primary_keys, chunk_size) -> np.ndarray:
+    """
+    First pass over the file, reading only the key columns: True for every row whose key occurs again
+    further down, which the upsert would overwrite. Rewinds the file.
+    """
+    hashes = [
+        row_hashes(canonical(df, table_obj, primary_keys)).to_numpy()
+        for df in pd.read_csv(fileobj, chunksize=chunk_size, usecols=primary_keys)
+    ]
+    fileobj.seek(0)
+    if not hashes:
+        return np.zeros(0, dtype=bool)
+    return pd.Series(np.concatenate(hashes)).duplicated(keep="last").to_numpy()
+
+
+def stored_value(value):
+    return None if value == NULL else value
+
+
+def diff_chunk(connection, table_obj, df: pd.DataFrame, primary_keys, compared):
+    """
+    Hash-joins a chunk of the upload with the stored rows on the primary key.
+    Returns the joined frame: the canonical upload columns, the stored ones suffixed "_current"
+    (missing for inserted rows), and a "change" column: inserted, updated or unchanged.
+    """
+    incoming = canonical(df, table_obj, primary_keys + compared)
+    incoming[HASH] = row_hashes(incoming[compared]).to_numpy()
+    current = canonical(fetch_current(connection, table_obj, primary_keys, compared, df), table_obj, primary_keys + compared)
+    current[HASH] = row_hashes(current[compared]).to_numpy()
+
+    joined = incoming.merge(current, on=primary_keys, how="left", suffixes=("", "_current"), indicator=True)
+    joined.index = df.index
+    inserted = joined["_merge"] == "left_only"
+    joined["change"] = "unchanged"
+    joined.loc[inserted, "change"] = "inserted"
+    joined.loc[~inserted & (joined[HASH] != joined[f"{HASH}_current"]), "change"] = "updated"
+    return joined
+
+
+def offer_transitions(connection, df: pd.DataFrame, joined: pd.DataFrame, latest_iteration):
+    """
+    (from, to) status of every uploaded ITERATION_OFFER row: the file's own status, or "accept & upgraded"
+    where the incremental recomputation would set it. The projection after the upload comes from an
+    IterationState of just these applicants with the file applied to it.
+    """
+    state = IterationState()
+    state.load(connection, df["app_no"])
+    state.apply_offers(df)
+    candidates = state.changed_paid_offers(df["app_no"])
+    upgraded = df["app_no"].isin(candidates.index[is_upgraded(candidates)]) & (df["itr_no"] == latest_iteration)
+
+    before = joined["status_current"].where(joined["_merge"] == "both", NULL)
+    after = df["status"].astype(object).where(df["status"].notna(), NULL).mask(upgraded, ACCEPT_UPGRADED)
+    return before, after
+
+
+def fees_transitions(connection, df: pd.DataFrame, latest_iteration):
+    """(from, to) status of the latest-iteration offer of every applicant in a FEES_PAID chunk."""
+    state = IterationState()
+    state.load(connection, df["app_no"])
+    history = state.history(df["app_no"])
+    statuses = classify_fees(df, history, latest_iteration)
+    history = history.reindex(statuses.index)
+    # Applicants without an offer in the latest iteration have no row to update
+    offered = history["itr_no"] == latest_iteration
+    return history.loc[offered, "status"].fillna(NULL), statuses[offered]
+
+
+def preview_upload(table_obj, fileobj, chunk_size: int = PREVIEW_CHUNK_SIZE):
+    """
+    Reports what uploading the CSV to `table_obj` would do, without writing anything: how many rows would
+    be inserted, updated or left unchanged (per column for updates, with examples), and for ITERATION_OFFER
+    and FEES_PAID the status transitions the upload would cause. Rows are compared by hashing them in bulk,
+    one query per chunk, never row by row.
+
+    Like the upsert, the last row of a key that occurs more than once wins; the earlier ones are counted
+    under "duplicates". The file must be seekable: it is read twice, once for the keys only. With recompute=full,
+    an ITERATION_OFFER upload can also change applicants outside the file; those are not previewed.
+    """
+    start_time = time.perf_counter()
+    primary_keys = [column.name for column in table_obj.primary_key]
+    if not primary_keys:
+        raise HTTPException(status_code=400, detail=f"{table_obj.name} has no primary key to compare uploads on.")
+    upper_table = table_obj.name.upper()
+    required_columns = upload_columns(table_obj)
+
+    counts = Counter()
+    changed_columns = Counter()
+    transitions = Counter()
+    samples = {"inserted": [], "updated": []}
+    latest_iteration = None
+
+    validate_csv_header(fileobj, required_columns)
+    superseded = superseded_rows(fileobj, table_obj, primary_keys, chunk_size)
+
+    with engine.connect() as connection:
+        for index, df in enumerate(read_csv_chunks(fileobj, chunk_size, required_columns)):
+            repeated = superseded[counts["rows"]:counts["rows"] + len(df)]
+            counts["rows"] += len(df)
+            counts["duplicates"] += int(repeated.sum())
+            df = df[~repeated]
+            if df.empty:
+                continue
+
+            compared = [
+                name for name in df.columns if name in table_obj.c and name not in primary_keys and name != "status_code"
+            ]
+            joined = diff_chunk(connection, table_obj, df, primary_keys, compared)
+            counts.update(joined["change"].value_counts().to_dict())
+
+            updated = joined[joined["change"] == "updated"]
+            for name in compared:
+                changed_columns[name] += int((updated[name] != updated[f"{name}_current"]).sum())
+            for _, row in joined[joined["change"] == "inserted"].head(PREVIEW_SAMPLE_ROWS - len(samples["inserted"])).iterrows():
+                samples["inserted"].append({name: stored_value(row[name]) for name in primary_keys})
+            for _, row in updated.head(PREVIEW_SAMPLE_ROWS - len(samples["updated"])).iterrows():
+                samples["updated"].append(
+                    {
+                        "key": {name: stored_value(row[name]) for name in primary_keys},
+                        "changes": {
+                            name: [stored_value(row[f"{name}_current"]), stored_value(row[name])]
+                            for name in compared
+                            if row[name] != row[f"{name}_current"]
+                        },
+                    }
+                )
+
+            before = after = None
+            if upper_table == "ITERATION_OFFER":
+                if index == 0:
+                    # The upload dates the file's first iteration now, which makes it the latest
+                    latest_iteration = int(df["itr_no"].iloc[0])
+                before, after = offer_transitions(connection, df, joined, latest_iteration)
+            elif upper_table == "FEES_PAID":
+                if index == 0:
+                    latest_iteration = get_latest_iteration(connection)
+                if latest_iteration is not None:
+                    before, after = fees_transitions(connection, df, latest_iteration)
+            if before is not None:
+                changed = before != after
+                transitions.update(
+                    (stored_value(status), stored_value(new_status))
+                    for status, new_status in zip(before[changed].tolist(), after[changed].tolist())
+                )
+
+    return {
+        "table": table_obj.name,
+        "dryRun": True,
+        "rows": counts["rows"],
+        "inserted": counts["inserted"],
+        "updated": counts["updated"],
+        "unchanged": counts["unchanged"],
+        "duplicates": counts["duplicates"],
+        "changedColumns": {name: count for name, count in changed_columns.items() if count},
+        "latestIteration": latest_iteration,
+        "statusTransitions": [
+            {"from": before, "to": after, "count": count} for (before, after), count in transitions.most_common()
+        ],
+        "samples": samples,
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }
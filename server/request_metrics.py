@@ -0,0 +1,219 @@
+# request_metrics.py
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Requests (and upload jobs) slower than this are logged with their most repeated SQL statements
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", 1.0))
+SLOW_REQUEST_TOP_STATEMENTS = int(os.environ.get("SLOW_REQUEST_TOP_STATEMENTS", 5))
+# Comma-separated client addresses (e.g. the Prometheus server) allowed to read /metrics without logging in
+METRICS_ALLOWED_IPS = {ip.strip() for ip in os.environ.get("METRICS_ALLOWED_IPS", "").split(",") if ip.strip()}
+
+METRIC_PREFIX = "admissions_"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000, 10000, 50000)
+
+
+class RequestStats:
+    """SQL work done on behalf of one request or upload job."""
+
+    def __init__(self, method: str, route: str):
+        self.method = method
+        self.route = route
+        self.status = "200"
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.statement_counts = Counter()
+        self._lock = threading.Lock()  # Handlers may run queries from the threadpool
+
+    def record_statement(self, statement: str, seconds: float):
+        with self._lock:
+            self.statements += 1
+            self.db_seconds += seconds
+            self.statement_counts[statement] += 1
+
+
+current_stats = contextvars.ContextVar("current_stats", default=None)
+
+
+class Histogram:
+    """Prometheus histogram with a fixed set of labels, rendered in the text exposition format."""
+
+    def __init__(self, name: str, help_text: str, buckets, labels=("method", "route")):
+        self.name = METRIC_PREFIX + name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value: float):
+        with self._lock:
+            series = self._series.setdefault(tuple(label_values), [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(self.labels, label_values))
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {values[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {values[-1]}")
+        return lines
+
+
+class CounterMetric:
+    """Prometheus counter with a fixed set of labels."""
+
+    def __init__(self, name: str, help_text: str, labels):
+        self.name = METRIC_PREFIX + name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount: float = 1):
+        with self._lock:
+            self._values[tuple(label_values)] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            labels = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(self.labels, label_values))
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+requests_total = CounterMetric("requests_total", "Requests and upload jobs handled.", ("method", "route", "status"))
+request_seconds = Histogram("request_duration_seconds", "Wall time per request or upload job.", DURATION_BUCKETS)
+request_db_seconds = Histogram("request_db_seconds", "Time spent in SQL statements per request.", DURATION_BUCKETS)
+request_statements = Histogram("request_sql_statements", "SQL statements executed per request.", STATEMENT_BUCKETS)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in (requests_total, request_seconds, request_db_seconds, request_statements):
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats.get() is not None:
+        conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    starts = conn.info.get("statement_start")
+    if stats is not None and starts:
+        stats.record_statement(statement, time.perf_counter() - starts.pop())
+
+
+def instrument(*engines):
+    """Attributes every statement run through these (sync) engines to the current request."""
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def track(method: str, route: str):
+    """
+    Collects the statements run inside the block, then records the request's metrics and logs it
+    if it was slow. Yields the RequestStats, whose `status` the caller can set.
+    """
+    stats = RequestStats(method, route)
+    token = current_stats.set(stats)
+    start = time.perf_counter()
+    try:
+        yield stats
+    except BaseException:
+        stats.status = "500"
+        raise
+    finally:
+        current_stats.reset(token)
+        record(stats, time.perf_counter() - start)
+
+
+def record(stats: RequestStats, seconds: float):
+    labels = (stats.method, stats.route)
+    requests_total.inc((stats.method, stats.route, stats.status))
+    request_seconds.observe(labels, seconds)
+    request_db_seconds.observe(labels, stats.db_seconds)
+    request_statements.observe(labels, stats.statements)
+
+    if seconds >= SLOW_REQUEST_SECONDS:
+        top = "".join(
+            f"\n  {count}x {' '.join(statement.split())[:300]}"
+            for statement, count in stats.statement_counts.most_common(SLOW_REQUEST_TOP_STATEMENTS)
+        )
+        logger.warning(
+            "Slow request %s %s (%s): %.2f s, %d statements, %.2f s in the database. Most repeated:%s",
+            stats.method,
+            stats.route,
+            stats.status,
+            seconds,
+            stats.statements,
+            stats.db_seconds,
+            top or " none",
+        )
+
+
+def route_template(scope) -> str:
+    """
+    The matched route with its path parameters put back, e.g. /data/{table_name}, so label values
+    stay bounded. Requests that matched no route share one label.
+    """
+    if scope.get("route") is None:
+        return "unmatched"
+    names = {str(value): f"{{{name}}}" for name, value in (scope.get("path_params") or {}).items()}
+    return "/".join(names.get(segment, segment) for segment in scope["path"].split("/"))
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording wall time, DB time and statement count per route. Pure ASGI rather than
+    BaseHTTPMiddleware so streamed response bodies are included in the timing.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track(scope["method"], scope["path"]) as stats:
+
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    stats.status = str(message["status"])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                stats.route = route_template(scope)
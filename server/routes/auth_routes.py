@@ -2,8 +2,10 @@ from fastapi import APIRouter, Request, Response, HTTPException, Depends, Cookie
 import logging
 from fastapi.responses import JSONResponse
 from sqlalchemy import select
-from db import user_table, engine
-from auth import create_access_token, get_password_hash, verify_password, SECRET_KEY, ALGORITHM
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import user_table, get_async_session
+from auth import create_access_token, get_password_hash_async, verify_password_async, SECRET_KEY, ALGORITHM
+from ttl_cache import TTLCache
 import jwt
 import os
 from datetime import datetime, timedelta
@@ -15,6 +17,13 @@ from sendgrid.helpers.mail import Mail
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Decoded token claims and USERS profiles are cached for at most AUTH_CACHE_TTL seconds
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", 1024))
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", 60))
+
+token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)  # token -> claims
+user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)  # email -> {"name", "role"}
+
 # ================================
 # Define validate_token dependency first
 # ================================
@@ -22,14 +31,38 @@ async def validate_token(token: str = Cookie(None)):
     """Validate JWT token on every request."""
     if not token:
         raise HTTPException(status_code=401, detail="Unauthorized")
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Never served past the token's own expiry
+        token_cache.set(token, payload, expires_at=payload.get("exp"))
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def get_user_profile(session, email: str):
+    """Returns {"name", "role"} of the user with this email, or None. Cached per email."""
+    profile = user_cache.get(email)
+    if profile is None:
+        user = (await session.execute(
+            select(user_table.c.name, user_table.c.role).where(user_table.c.email == email)
+        )).mappings().fetchone()
+        if not user:
+            return None
+        profile = dict(user)
+        user_cache.set(email, profile)
+    return profile
+
+
+def invalidate_user(email: str):
+    """Drops the cached profile and token claims of a user; call after a password reset or role change."""
+    user_cache.pop(email)
+    token_cache.pop_where(lambda claims: claims.get("sub") == email)
+
 # ================================
 # New: Forgot/Reset Password using SendGrid
 # ================================
@@ -56,7 +89,7 @@ def send_email(to_email: str, subject: str, body: str):
         raise HTTPException(status_code=500, detail="Failed to send reset email.")
 
 @router.post("/forgot-password")
-async def forgot_password(request: Request):
+async def forgot_password(request: Request, session: AsyncSession = Depends(get_async_session)):
     """
     Endpoint to initiate forgot password flow.
     Expects JSON body with:
@@ -69,8 +102,7 @@ async def forgot_password(request: Request):
         if not email:
             raise HTTPException(status_code=400, detail="Email is required.")
         
-        with engine.connect() as connection:
-            user = connection.execute(select(user_table).where(user_table.c.email == email)).fetchone()
+        user = (await session.execute(select(user_table).where(user_table.c.email == email))).fetchone()
         if not user:
             raise HTTPException(status_code=404, detail="User not found.")
         
@@ -92,7 +124,11 @@ async def forgot_password(request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/reset-password")
-async def reset_password(token: str = Form(...), new_password: str = Form(...)):
+async def reset_password(
+    token: str = Form(...),
+    new_password: str = Form(...),
+    session: AsyncSession = Depends(get_async_session),
+):
     """
     Endpoint to reset password using the reset token.
     Expects form-data with:
@@ -106,16 +142,16 @@ async def reset_password(token: str = Form(...), new_password: str = Form(...)):
         if token_type != "reset":
             raise HTTPException(status_code=400, detail="Invalid token type.")
         
-        with engine.connect() as connection:
-            user = connection.execute(select(user_table).where(user_table.c.email == email)).fetchone()
+        user = (await session.execute(select(user_table).where(user_table.c.email == email))).fetchone()
         if not user:
             raise HTTPException(status_code=404, detail="User not found.")
         
-        hashed_password = get_password_hash(new_password)
-        with engine.begin() as connection:
-            connection.execute(
-                user_table.update().where(user_table.c.email == email).values(hashed_password=hashed_password)
-            )
+        hashed_password = await get_password_hash_async(new_password)
+        await session.execute(
+            user_table.update().where(user_table.c.email == email).values(hashed_password=hashed_password)
+        )
+        await session.commit()
+        invalidate_user(email)
         return {"message": "Password has been reset successfully."}
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=400, detail="Reset token expired.")
@@ -130,9 +166,12 @@ async def reset_password(token: str = Form(...), new_password: str = Form(...)):
 # ================================
 
 ALLOWED_ROLES = {"admin", "view", "view_and_withdraw"}
+ALLOWED_CAMPUSES = ["Pilani", "Goa", "Hyderabad"]
 
 @router.post("/register")
-async def register_user(request: Request, response: Response):
+async def register_user(
+    request: Request, response: Response, session: AsyncSession = Depends(get_async_session)
+):
     """
     Register a new user.
     Expects JSON body with:
@@ -161,28 +200,27 @@ async def register_user(request: Request, response: Response):
             raise HTTPException(status_code=400, detail="All fields are required.")
         if password != confirm_password:
             raise HTTPException(status_code=400, detail="Passwords do not match.")
-        if campus not in ["Pilani", "Goa", "Hyderabad"]:
+        if campus not in ALLOWED_CAMPUSES:
             raise HTTPException(status_code=400, detail="Invalid campus selection.")
         if role not in ALLOWED_ROLES:
             raise HTTPException(status_code=400, detail="Invalid role. Allowed roles: admin, view, view_and_withdraw.")
 
-        with engine.connect() as connection:
-            existing_user = connection.execute(select(user_table).where(user_table.c.email == email)).fetchone()
-            if existing_user:
-                raise HTTPException(status_code=400, detail="User already exists.")
+        existing_user = (await session.execute(select(user_table).where(user_table.c.email == email))).fetchone()
+        if existing_user:
+            raise HTTPException(status_code=400, detail="User already exists.")
 
-        hashed_password = get_password_hash(password)
-        with engine.begin() as connection:
-            connection.execute(
-                user_table.insert().values(
-                    name=name,
-                    email=email,
-                    contact=contact,
-                    campus=campus,
-                    hashed_password=hashed_password,
-                    role=role
-                )
+        hashed_password = await get_password_hash_async(password)
+        await session.execute(
+            user_table.insert().values(
+                name=name,
+                email=email,
+                contact=contact,
+                campus=campus,
+                hashed_password=hashed_password,
+                role=role
             )
+        )
+        await session.commit()
         access_token = create_access_token({"sub": email, "role": role})
         response.set_cookie(
             key="token",
@@ -198,7 +236,9 @@ async def register_user(request: Request, response: Response):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/login")
-async def login_user(request: Request, response: Response):
+async def login_user(
+    request: Request, response: Response, session: AsyncSession = Depends(get_async_session)
+):
     """
     Log in an existing user.
     Expects JSON body with:
@@ -214,17 +254,23 @@ async def login_user(request: Request, response: Response):
         logger.info("Attempting login for email: %s", email)
         if not email or not password:
             raise HTTPException(status_code=400, detail="Email and password required.")
-        with engine.connect() as connection:
-            user = connection.execute(
-                select(user_table).where(user_table.c.email == email)
-            ).mappings().fetchone()
-            if not user:
-                logger.info("User not found for email: %s", email)
-                raise HTTPException(status_code=400, detail="Invalid email or password.")
-            hashed_password = user["hashed_password"]
-            if not verify_password(password, hashed_password):
-                logger.info("Password verification failed for email: %s", email)
-                raise HTTPException(status_code=400, detail="Invalid email or password.")
+        user = (await session.execute(
+            select(user_table).where(user_table.c.email == email)
+        )).mappings().fetchone()
+        if not user:
+            logger.info("User not found for email: %s", email)
+            raise HTTPException(status_code=400, detail="Invalid email or password.")
+        hashed_password = user["hashed_password"]
+        valid, new_hash = await verify_password_async(password, hashed_password)
+        if not valid:
+            logger.info("Password verification failed for email: %s", email)
+            raise HTTPException(status_code=400, detail="Invalid email or password.")
+        if new_hash:
+            # Stored with an older BCRYPT_ROUNDS; re-hashed with the current cost
+            await session.execute(
+                user_table.update().where(user_table.c.email == email).values(hashed_password=new_hash)
+            )
+            await session.commit()
         # Include role in the token
         access_token = create_access_token({"sub": email, "role": user["role"]})
         response.set_cookie(
@@ -254,14 +300,13 @@ async def logout_user(response: Response):
     return {"message": "Logged out"}
 
 @router.get("/user")
-async def get_user(payload: dict = Depends(validate_token)):
+async def get_user(
+    payload: dict = Depends(validate_token), session: AsyncSession = Depends(get_async_session)
+):
     email = payload.get("sub")
     if not email:
         raise HTTPException(status_code=401, detail="Invalid token payload.")
-    with engine.connect() as connection:
-        user = connection.execute(
-            select(user_table).where(user_table.c.email == email)
-        ).mappings().fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found.")
-        return {"name": user["name"], "role": user["role"]}
+    user = await get_user_profile(session, email)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found.")
+    return {"name": user["name"], "role": user["role"]}
@@ -1,55 +1,168 @@
+import base64
+import csv
 import io
+import json
 import logging
-from datetime import datetime
-
-import pandas as pd
-import requests
-from db import (
-    SessionLocal,
-    engine,
-    fees_paid_table,
-    iteration_date_table,
-    iteration_offer_table,
-    logs_table,
-    metadata,
-    user_table,
-)
-import pandas as pd
-
-from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile
+
+from bulk import UPLOAD_CHUNK_SIZE
+from db import async_engine, get_async_session, metadata, upload_jobs_table
+from jobs import job_progress, submit_upload
+from preview import preview_upload
+from serialization import FastJSONResponse, columns as columnar_payload, dumps, records
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import and_
-from sqlalchemy import select
-from sqlalchemy.dialects.mysql import insert
-from starlette.responses import JSONResponse
-from .auth_routes import validate_token
-from fastapi import Request
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import JSONResponse, StreamingResponse
+from .auth_routes import get_user_profile, validate_token
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-def clean_nan_values(row: dict):
-    """Replaces NaN values with None (so they can be stored as NULL in MySQL)."""
-    return {key: (None if pd.isna(value) else value) for key, value in row.items()}
+STREAM_BATCH_SIZE = 1000  # Rows fetched per round trip from the server-side cursor
+# Bookkeeping and credentials, never read or written through /data or /update: spool paths and uploader
+# IPs, applied migrations, the LATEST_OFFER projection the uploads maintain, and password hashes
+INTERNAL_TABLES = {"UPLOAD_JOBS", "SCHEMA_MIGRATIONS", "LATEST_OFFER", "USERS"}
+
+
+def get_table(table_name: str):
+    """The table served at /data/{table_name} and /update/{table_name}; 400 if there is none."""
+    table_obj = metadata.tables.get(table_name)
+    if table_obj is None or table_obj.name in INTERNAL_TABLES:
+        raise HTTPException(status_code=400, detail=f"Table {table_name} does not exist.")
+    return table_obj
+
+
+def encode_cursor(values):
+    """Encodes the primary key of the last returned row as an opaque `after` cursor."""
+    return base64.urlsafe_b64encode(json.dumps(jsonable_encoder(values)).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Returns the primary key values encoded in an `after` cursor; anything else is a 400."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return values
+
+
+def build_data_query(table_obj, columns, where, limit, after):
+    """
+    Builds the SELECT for /data/{table_name}: column projection, `column:value` equality filters and,
+    when `limit` is given, keyset pagination on the primary key.
+    Returns the statement and the names of the columns to send back.
+    """
+    if columns:
+        names = [name.strip() for name in columns.split(",") if name.strip()]
+        unknown = [name for name in names if name not in table_obj.c]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns: {unknown}")
+    else:
+        names = list(table_obj.columns.keys())
+
+    primary_keys = list(table_obj.primary_key.columns)
+    # Primary key columns are always selected so the next cursor can be built
+    selected = names + [col.name for col in primary_keys if col.name not in names]
+    stmt = select(*[table_obj.c[name] for name in selected])
+
+    for condition in where or []:
+        name, separator, value = condition.partition(":")
+        if not separator or name not in table_obj.c:
+            raise HTTPException(status_code=400, detail=f"Invalid filter '{condition}', expected column:value.")
+        stmt = stmt.where(table_obj.c[name] == value)
+
+    if limit is not None or after is not None:
+        if not primary_keys:
+            raise HTTPException(status_code=400, detail=f"Table {table_obj.name} has no primary key to paginate on.")
+        if after is not None:
+            values = decode_cursor(after)
+            if len(values) != len(primary_keys):
+                raise HTTPException(status_code=400, detail="Invalid cursor.")
+            stmt = stmt.where(tuple_(*primary_keys) > tuple_(*values))
+        stmt = stmt.order_by(*primary_keys)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+
+    return stmt, names
+
+
+async def stream_rows(stmt, names, output_format):
+    """
+    Yields the query result as NDJSON lines or CSV text, fetched in batches from a server-side cursor.
+    Uses its own connection, since the response outlives the request's session.
+    """
+    async with async_engine.connect() as connection:
+        result = await connection.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        if output_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(names)
+            async for batch in result.partitions():
+                writer.writerows([[row._mapping[name] for name in names] for row in batch])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            async for batch in result.partitions():
+                yield b"".join(dumps(record) + b"\n" for record in records(names, batch))
+
 
 @router.get("/data/{table_name}")
-async def read_data(table_name: str):
+async def read_data(
+    table_name: str,
+    limit: int = Query(None, gt=0, description="Page size; enables keyset pagination on the primary key"),
+    after: str = Query(None, description="Cursor returned as nextCursor by the previous page"),
+    columns: str = Query(None, description="Comma-separated columns to return"),
+    where: list[str] = Query(None, description="Equality filters as column:value"),
+    format: str = Query("json", pattern="^(json|columns|ndjson|csv)$"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    format=json returns {"data": [{column: value}, ...]}; format=columns returns the same rows as
+    {"columns": [...], "rows": [[...], ...]}, which is smaller and faster to build for large pages.
+    ndjson and csv are streamed.
+    """
     try:
-        table_obj = metadata.tables.get(table_name)
-        if table_obj is None:
-            raise HTTPException(status_code=400, detail=f"Table {table_name} does not exist.")
-        with engine.connect() as connection:
-            result = connection.execute(table_obj.select())
-            data = [jsonable_encoder(dict(row._mapping)) for row in result]
-
-        return JSONResponse(content={"data": data}, status_code=200)
+        table_obj = get_table(table_name)
+        stmt, names = build_data_query(table_obj, columns, where, limit, after)
+
+        if format in ("ndjson", "csv"):
+            media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+            return StreamingResponse(stream_rows(stmt, names, format), media_type=media_type)
+
+        rows = (await session.execute(stmt)).fetchall()
+        content = columnar_payload(names, rows) if format == "columns" else {"data": records(names, rows)}
+        if limit is not None:
+            last_key = [rows[-1]._mapping[col.name] for col in table_obj.primary_key] if rows else None
+            content["nextCursor"] = encode_cursor(last_key) if len(rows) == limit else None
+        return FastJSONResponse(content=content, status_code=200)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error reading data from table %s", table_name)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/update/{table_name}")
-async def update_data(request: Request ,table_name: str, file: UploadFile, payload: dict = Depends(validate_token) ):
-    session = SessionLocal()
+async def update_data(
+    request: Request,
+    table_name: str,
+    file: UploadFile,
+    chunk_size: int = Query(UPLOAD_CHUNK_SIZE, gt=0, description="Rows per multi-row upsert"),
+    recompute: str = Query(
+        "incremental",
+        pattern="^(incremental|full)$",
+        description="Status recomputation after an ITERATION_OFFER upload",
+    ),
+    dry_run: bool = Query(False, description="Only report what the upload would change; nothing is written"),
+    payload: dict = Depends(validate_token),
+    session: AsyncSession = Depends(get_async_session),
+):
     try:
 
         user_email = payload.get("sub")
@@ -59,8 +172,7 @@ async def update_data(request: Request ,table_name: str, file: UploadFile, paylo
             raise HTTPException(status_code=401, detail="Invalid token payload.")
 
         # Fetch user details from the database
-        stmt = select(user_table.c.name, user_table.c.role).where(user_table.c.email == user_email)
-        user = session.execute(stmt).mappings().fetchone()
+        user = await get_user_profile(session, user_email)
 
         if not user:
             raise HTTPException(status_code=404, detail="User not found.")
@@ -70,237 +182,50 @@ async def update_data(request: Request ,table_name: str, file: UploadFile, paylo
 
         # Print or log the user's name and role
 
-        contents = await file.read()
-        df = pd.read_csv(io.BytesIO(contents))
-
-        table_obj = metadata.tables.get(table_name)
-        if table_obj is None:
-            raise HTTPException(status_code=400, detail=f"Table {table_name} does not exist.")
-        table_columns = set(table_obj.columns.keys())
-        if not table_columns.issubset(set(df.columns)):
-            raise HTTPException(
-                status_code=400, detail=f"CSV must contain columns: {table_columns}"
-            )
-
-        with engine.begin() as connection:
-
-            primary_keys = [col.name for col in table_obj.primary_key]
-            for _, row in df.iterrows():
-                row = clean_nan_values(dict(row))
-
-                stmt = insert(table_obj).values(row)
-                stmt = stmt.on_duplicate_key_update(
-                    {key: row_key for (key, row_key) in row.items() if key not in primary_keys}
-                )
-                connection.execute(stmt)
-
-            upper_table = table_name.upper()
-            if upper_table == "ITERATION_OFFER":
-                if not df.empty:
-                    iteration_value = df.at[0, "itr_no"]
-
-                    current_time = datetime.now()
-                    stmt = insert(iteration_date_table).values(
-                        iteration=iteration_value, date=current_time
-                    )
-                    stmt = stmt.on_duplicate_key_update(date=current_time)
-                    connection.execute(stmt)
-
-
-
-                """if "uploaded_by" not in df.columns or "upload_datetime" not in df.columns:
-                    raise HTTPException(status_code=400, detail="Missing required columns in CSV.")
-
-                # Modify the "uploaded_by" and "upload_datetime" columns
-                df["uploaded_by"] = f"{user_name} ({user_role})"
-                df["upload_datetime"] = datetime.now().isoformat()
-                """
-
-
-                result = connection.execute(
-                    iteration_date_table.select()
-                    .order_by(iteration_date_table.c.date.desc())
-                    .limit(1)
-                )
-                latest_iteration_record = result.fetchone()
-                if latest_iteration_record is not None:
-                    latest_iteration = latest_iteration_record[0]
-
-                    fees_records = connection.execute(fees_paid_table.select()).mappings().all()
-
-                    for row in fees_records:
-                        app_no = row["app_no"]
-                        admission_paid = bool(row["admission_fees_status"])
-                        tuition_paid = bool(row["tution_fees_status"])
-
-                        new_status = None
-
-                        if admission_paid and tuition_paid:
-                            iteration_result = (
-                                connection.execute(
-                                    iteration_offer_table.select()
-                                    .where(iteration_offer_table.c.app_no == app_no)
-                                    .order_by(iteration_offer_table.c.itr_no.desc())
-                                    .limit(2)
-                                )
-                                .mappings()
-                                .all()
-                            )  # This ensures you get dictionaries instead of tuples
-
-                            iterations = iteration_result
-
-                            if (
-                                len(iterations) == 2
-                                and iterations[0]["offer"] != iterations[1]["offer"]
-                                and "accept" in iterations[1]["status"]
-                            ):
-                                new_status = "accept & upgraded"
-
-                        if new_status is not None:
-                            update_stmt = (
-                                iteration_offer_table.update()
-                                .where(
-                                    and_(
-                                        iteration_offer_table.c.app_no == app_no,
-                                        iteration_offer_table.c.itr_no == latest_iteration,
-                                ))
-                                .values(status=new_status)
-                            )
-                            connection.execute(update_stmt)
-
-            elif upper_table == "FEES_PAID":
-
-
-
-                uploaded_by_value = f"{user_name} {user_role}"
-                upload_datetime_value = datetime.now().isoformat()  # Convert to string for CSV
-
-            # Update columns based on status conditions
-                df.loc[df["admission_fees_status"] == 1, "admission_fees_uploaded_by"] = uploaded_by_value
-                df.loc[df["admission_fees_status"] == 1, "admission_fees_upload_date_time"] = upload_datetime_value
-
-                df.loc[df["tution_fees_status"] == 1, "tution_fees_uploaded_by"] = uploaded_by_value
-                df.loc[df["tution_fees_status"] == 1, "tution_fees_upload_date_time"] = upload_datetime_value
-                result = connection.execute(
-                    iteration_date_table.select()
-                    .order_by(iteration_date_table.c.date.desc())
-                    .limit(1)
-                )
-                latest_iteration_record = result.fetchone()
-                if latest_iteration_record is not None:
-                    latest_iteration = latest_iteration_record[0]
-                    for row in df.itertuples():
-                        app_no = row.app_no
-                        admission_paid = bool(row.admission_fees_status)
-                        tuition_paid = bool(row.tution_fees_status)
-
-                        if admission_paid and tuition_paid:
-                            iteration_result = (
-                                connection.execute(
-                                    iteration_offer_table.select()
-                                    .where(iteration_offer_table.c.app_no == app_no)
-                                    .order_by(iteration_offer_table.c.itr_no.desc())
-                                    .limit(2)
-                                )
-                                .mappings()
-                                .all()
-                            )
-                            iterations = iteration_result
-                            if (
-                                len(iterations) == 2
-                                and iterations[0]["offer"] != iterations[1]["offer"]
-                                and "accept" in iterations[1]["status"]
-                            ):
-                                new_status = "accept & upgraded"
-                            else:
-                                new_status = "accept"
-                        elif not admission_paid and not tuition_paid:
-                            new_status = "withdraw"
-                        elif admission_paid and not tuition_paid:
-                            latest_offer_result = connection.execute(
-                                iteration_offer_table.select().where(
-                                    and_(
-                                        iteration_offer_table.c.app_no == app_no,
-                                        iteration_offer_table.c.itr_no == latest_iteration,
-                                ))
-                            ).fetchone()
-                            latest_offer = latest_offer_result[2] if latest_offer_result else None
-
-                            if latest_offer == "WL":
-                                new_status = "upgrade"
-                            else:
-                                new_status = "withdraw"
-                        else:
-                            # both not paid
-                            # waitlist -> both not paid
-                            new_status = "withdraw"
-
-                        update_stmt = (
-                            iteration_offer_table.update()
-                            .where(
-                                and_(
-                                    iteration_offer_table.c.app_no == app_no,
-                                    iteration_offer_table.c.itr_no == latest_iteration,
-                            ))
-                            .values(status=new_status)
-                        )
-                        connection.execute(update_stmt)
-
-        print("now updating logtable")
-
-        data = {
-            "file_name": file.filename,
-            "category": upper_table,
-            "uploaded_by": f"{user_name} {user_role}",
-            "remark": "Initial upload",
-            "ip_address" : request.client.host
-
-        }
-        print("now updating logtable")
-        response = update_log_table(data)
-        print(response)
+        table_obj = get_table(table_name)
+
+        if dry_run:
+            # Diffed against the tables in the request itself: no job, no spooled file, no writes
+            report = await run_in_threadpool(preview_upload, table_obj, file.file)
+            return JSONResponse(content=report, status_code=200)
+
+        # Parsing, upserting and status recomputation run on the upload worker pool;
+        # progress is polled from GET /jobs/{job_id}. Spooling the file is blocking I/O.
+        job_id = await run_in_threadpool(
+            submit_upload,
+            file,
+            table_obj.name,
+            chunk_size,
+            recompute,
+            uploaded_by=f"{user_name} {user_role}",
+            ip_address=request.client.host,
+        )
 
         return JSONResponse(
-            content={"message": f"Data updated successfully in {table_name}!"}, status_code=200
+            content={
+                "message": f"Upload to {table_name} queued.",
+                "jobId": job_id,
+                "chunkSize": chunk_size,
+            },
+            status_code=202,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error updating data for table %s", table_name)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def update_log_table(data):
-    try:
-        print("Received request to update logs")  # Debug log
-
-        
-        user_ip = data.get("ip_address")
-        upload_date = datetime.now().isoformat()
-
-        file_name = data.get("file_name")
-        category = data.get("category")
-        uploaded_by = data.get("uploaded_by")
-        remark = data.get("remark")
-
-        if not all([file_name, category, uploaded_by, remark]):
-            print("Missing required fields")
-            raise HTTPException(status_code=400, detail="Missing required fields.")
-
-        stmt = insert(logs_table).values(
-            file_name=file_name,
-            category=category,
-            upload_date=upload_date,
-            uploaded_by=uploaded_by,
-            remark=remark,
-            ip_address=user_ip,
-        )
-
-        with engine.begin() as connection:
-            print("Inserting into logs_table...")  # Debug log
-            connection.execute(stmt)
-
-        print("Log entry added successfully!")  # Debug log
-        return JSONResponse(content={"message": "Log entry added successfully!"}, status_code=201)
-
-    except Exception as e:
-        print(f"Exception occurred: {e}")  # Debug log
-        raise HTTPException(status_code=500, detail=str(e))
+@router.get("/jobs/{job_id}")
+async def get_upload_job(
+    job_id: str,
+    payload: dict = Depends(validate_token),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Reports the progress of a background upload: phase, rows ingested and classified, and ETA."""
+    job = (
+        await session.execute(select(upload_jobs_table).where(upload_jobs_table.c.job_id == job_id))
+    ).mappings().fetchone()
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Upload job {job_id} not found.")
+    return JSONResponse(content=jsonable_encoder(job_progress(job)), status_code=200)
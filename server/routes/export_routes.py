@@ -0,0 +1,193 @@
+import io
+import zlib
+
+from db import async_engine, fees_paid_table, iteration_offer_table, latest_offer_table, master_table
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import BigInteger, DateTime, Integer, SmallInteger, select
+from starlette.responses import StreamingResponse
+from status import STATUS_CODES
+from .auth_routes import ALLOWED_CAMPUSES, validate_token
+from .data_routes import STREAM_BATCH_SIZE, stream_rows
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet exports are optional
+    pa = None
+
+router = APIRouter()
+
+EXPORT_GZIP_LEVEL = 6
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Whether an Accept-Encoding header allows gzip: listed (or matched by "*") with a q-value above 0.
+    An explicit "gzip;q=0" refuses it even if "*" is accepted.
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    weight = weights.get("gzip", weights.get("x-gzip", weights.get("*", 0.0)))
+    return weight > 0
+
+
+def status_filter(column, statuses):
+    """IN filter on a status_code column for the given status names; 400 on an unknown name."""
+    unknown = [status for status in statuses if status not in STATUS_CODES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown statuses {unknown}, expected {list(STATUS_CODES)}.")
+    return column.in_([STATUS_CODES[status] for status in statuses])
+
+
+def campus_filter(column, campus):
+    """
+    The schema has no campus column: uploads record it as the uploader ("Pilani Admin"),
+    so a campus matches the rows uploaded by that campus.
+    """
+    if campus not in ALLOWED_CAMPUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown campus {campus}, expected {ALLOWED_CAMPUSES}.")
+    return column.like(f"{campus} %")
+
+
+async def gzip_chunks(chunks):
+    """Compresses a stream of text chunks into one gzip member, chunk by chunk."""
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def arrow_type(column):
+    if isinstance(column.type, (Integer, SmallInteger, BigInteger)):
+        return pa.int64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+async def stream_parquet(stmt):
+    """Yields a Parquet file written one row group per fetched batch, so memory stays bounded."""
+    schema = pa.schema([(column.name, arrow_type(column)) for column in stmt.selected_columns])
+    sink = io.BytesIO()
+    writer = pq.ParquetWriter(sink, schema)
+    async with async_engine.connect() as connection:
+        result = await connection.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for batch in result.partitions():
+            columns = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays([pa.array(values, field.type) for values, field in zip(columns, schema)], schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    writer.close()
+    yield sink.getvalue()
+
+
+def export_response(request: Request, stmt, filename: str, format: str):
+    """
+    Streams `stmt` as CSV or Parquet from a server-side cursor.
+    CSV is gzip-compressed on the fly (Content-Encoding: gzip) when the client accepts it.
+    """
+    if format == "parquet":
+        if pa is None:
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow on the server.")
+        return StreamingResponse(
+            stream_parquet(stmt),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.parquet"'},
+        )
+
+    names = [column.name for column in stmt.selected_columns]
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.csv"', "Vary": "Accept-Encoding"}
+    chunks = stream_rows(stmt, names, "csv")
+    if accepts_gzip(request.headers.get("accept-encoding", "")):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type="text/csv", headers=headers)
+
+
+@router.get("/export/iterations")
+async def export_iterations(
+    request: Request,
+    iteration: int = Query(None, description="Iteration number; all iterations if omitted"),
+    status: list[str] = Query(None, description="Only these statuses, e.g. status=accept&status=upgrade"),
+    campus: str = Query(None, description="Only offers uploaded by this campus"),
+    format: str = Query("csv", pattern="^(csv|parquet)$"),
+    payload: dict = Depends(validate_token),
+):
+    """
+    Exports ITERATION_OFFER rows with the applicant's name:
+    app_no, name, itr_no, offer, scholarship, status, uploaded_by, upload_datetime.
+    """
+    stmt = (
+        select(
+            iteration_offer_table.c.app_no,
+            master_table.c.name,
+            iteration_offer_table.c.itr_no,
+            iteration_offer_table.c.offer,
+            iteration_offer_table.c.scholarship,
+            iteration_offer_table.c.status,
+            iteration_offer_table.c.uploaded_by,
+            iteration_offer_table.c.upload_datetime,
+        )
+        .select_from(iteration_offer_table)
+        .outerjoin(master_table, master_table.c.app_no == iteration_offer_table.c.app_no)
+    )
+    filename = "iterations"
+    if iteration is not None:
+        stmt = stmt.where(iteration_offer_table.c.itr_no == iteration)
+        filename = f"iteration_{iteration}"
+    if status:
+        stmt = stmt.where(status_filter(iteration_offer_table.c.status_code, status))
+    if campus:
+        stmt = stmt.where(campus_filter(iteration_offer_table.c.uploaded_by, campus))
+        filename += f"_{campus.lower()}"
+    stmt = stmt.order_by(iteration_offer_table.c.itr_no, iteration_offer_table.c.app_no)
+    return export_response(request, stmt, filename, format)
+
+
+@router.get("/export/fees")
+async def export_fees(
+    request: Request,
+    iteration: int = Query(None, description="Only applicants whose latest offer is from this iteration"),
+    status: list[str] = Query(None, description="Only applicants whose latest offer has these statuses"),
+    campus: str = Query(None, description="Only fees uploaded by this campus"),
+    format: str = Query("csv", pattern="^(csv|parquet)$"),
+    payload: dict = Depends(validate_token),
+):
+    """Exports FEES_PAID rows with each applicant's latest iteration, offer and status from LATEST_OFFER."""
+    stmt = (
+        select(
+            *fees_paid_table.c,
+            latest_offer_table.c.itr_no,
+            latest_offer_table.c.offer,
+            latest_offer_table.c.status,
+        )
+        .select_from(fees_paid_table)
+        .outerjoin(latest_offer_table, latest_offer_table.c.app_no == fees_paid_table.c.app_no)
+    )
+    filename = "fees"
+    if iteration is not None:
+        stmt = stmt.where(latest_offer_table.c.itr_no == iteration)
+        filename += f"_iteration_{iteration}"
+    if status:
+        stmt = stmt.where(status_filter(latest_offer_table.c.status_code, status))
+    if campus:
+        stmt = stmt.where(campus_filter(fees_paid_table.c.admission_fees_uploaded_by, campus))
+        filename += f"_{campus.lower()}"
+    stmt = stmt.order_by(fees_paid_table.c.app_no)
+    return export_response(request, stmt, filename, format)
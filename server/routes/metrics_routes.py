@@ -0,0 +1,36 @@
+from db import pool_metrics, worker_pool_metrics
+from fastapi import APIRouter, Cookie, Depends, Request
+from fastapi.responses import PlainTextResponse
+from request_metrics import METRICS_ALLOWED_IPS, render_metrics
+from .auth_routes import validate_token
+
+router = APIRouter()
+# Included without the /api prefix: Prometheus scrapes /metrics by default
+prometheus_router = APIRouter()
+
+
+@router.get("/pool")
+async def get_pool_metrics(payload: dict = Depends(validate_token)):
+    """
+    Connection pool usage, for sizing DB_POOL_SIZE / DB_MAX_OVERFLOW:
+      - requests: the pool of the request handlers, including how long requests waited for a connection
+      - workers: the pool of the upload workers
+    saturation is checkedOut / capacity; waits approaching DB_POOL_TIMEOUT or any timeouts mean the pool is too small.
+    """
+    return {"requests": pool_metrics.snapshot(), "workers": worker_pool_metrics.snapshot()}
+
+
+async def metrics_access(request: Request, token: str = Cookie(None)):
+    """Scrapers listed in METRICS_ALLOWED_IPS are let through; everyone else needs a valid login token."""
+    if request.client is not None and request.client.host in METRICS_ALLOWED_IPS:
+        return
+    await validate_token(token)
+
+
+@prometheus_router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(metrics_access)])
+async def get_prometheus_metrics():
+    """
+    Prometheus histograms of wall time, DB time and SQL statement count per route, labelled by method
+    and route template. Upload jobs appear as method JOB on their /update/{table} route.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
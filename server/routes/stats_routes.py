@@ -1,119 +1,101 @@
-import io
 from datetime import datetime
 
 import pandas as pd
+
 from db import (
-    SessionLocal,
     fees_paid_table,
+    get_async_session,
     iteration_date_table,
     iteration_offer_table,
-    user_table,
+    latest_offer_table,
     master_table,
-    withdraws_table,
 )
-from fastapi import APIRouter, File, HTTPException, Query, UploadFile
-from fastapi.encoders import jsonable_encoder
-from sqlalchemy import and_, func, insert, select, update
+from ingest import read_csv_chunks
+from iteration_state import iteration_state
+from search import SEARCH_LIMIT, search_app_nos, search_names
+from serialization import FastJSONResponse, dictionary_encode, records
+from stats_cache import get_cached_stats, invalidate_stats
+from status import ACCEPT_CODES, withdraw_applicants
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 
 
 
 router = APIRouter()
+
+# Accept header value that selects the columnar /iterations payload, as format=columns does
+COLUMNAR_MEDIA_TYPE = "application/vnd.iterations.columns+json"
+
+
 @router.get("/stats")
-def get_stats():
+async def get_stats(session: AsyncSession = Depends(get_async_session)):
     """
     Returns statistics including:
       - totalApplications: Total number of applications from MASTER_TABLE.
       - acceptedStudents: Count of offers with status 'accept' from ITERATION_OFFER.
       - latestIterationNumber and latestIterationDate: The latest iteration details from ITERATION_DATE.
       - genderStats: Count of male and female applicants whose latest iteration status is 'accept'.
+
+    Served from an in-process cache that uploads and withdrawals invalidate (see stats_cache.py).
     """
-    session = SessionLocal()
     try:
-        # Total applications from MASTER_TABLE.
-        stmt_total = select(func.count()).select_from(master_table)
-        total_applications = session.execute(stmt_total).scalar() or 0
-
-        # Subquery to find the latest iteration for each student.
-        latest_itr_subquery = (
-            select(
-                iteration_offer_table.c.app_no,
-                func.max(iteration_offer_table.c.itr_no).label("latest_itr"),
-            )
-            .group_by(iteration_offer_table.c.app_no)
-            .subquery()
-        )
-
-        # Query to find students whose latest iteration status is 'accept'.
-        stmt_accepted = (
-            select(iteration_offer_table.c.app_no)
-            .join(
-                latest_itr_subquery,
-                and_(
-                    iteration_offer_table.c.app_no == latest_itr_subquery.c.app_no,
-                    iteration_offer_table.c.itr_no == latest_itr_subquery.c.latest_itr,
-                ),
-            )
-            .where(iteration_offer_table.c.status.like("%accept%"))
-        )
-
-        accepted_stats = session.execute(stmt_accepted).fetchall()
-
-        #print(len(accepted_stats))
-        # Join with MASTER_TABLE to get gender of accepted students.
-        stmt_gender = (
-            select(master_table.c.gender, func.count().label("count"))
-            .join(
-                iteration_offer_table,  # Join iteration_offer_table directly
-                master_table.c.app_no == iteration_offer_table.c.app_no,
-            )
-            .join(
-                latest_itr_subquery,
-                and_(
-                    iteration_offer_table.c.app_no == latest_itr_subquery.c.app_no,
-                    iteration_offer_table.c.itr_no == latest_itr_subquery.c.latest_itr,
-                ),
-            )
-            .where(iteration_offer_table.c.status.like("%accept%"))
-            .group_by(master_table.c.gender)
-        )
-        gender_stats = session.execute(stmt_gender).fetchall()
-        #print(gender_stats)
-        # Convert gender stats to a dictionary
-        gender_dict = {gender: count for gender, count in gender_stats} if gender_stats else {}
-
-        # Retrieve the latest iteration record (ordered by date descending).
-        stmt_latest = (
-            select(iteration_date_table)
-            .order_by(iteration_date_table.c.date.desc())
-            .limit(1)
-
-        )
-        latest_record = session.execute(stmt_latest).fetchone()
-
-        if latest_record:
-            latest_iteration = latest_record.iteration
-            latest_iteration_date = latest_record.date
-        else:
-            # Defaults: 0 for iteration number and today's date.
-            latest_iteration = 0
-            latest_iteration_date = datetime.now()
-
-        return {
-            "totalApplications": total_applications,
-            "acceptedStudents": len(accepted_stats),  # Count of accepted students
-            "latestIterationNumber": latest_iteration,
-            "latestIterationDate": latest_iteration_date,
-            "genderStats": gender_dict,  # Add gender stats to the response
-        }
+        return await get_cached_stats(lambda: compute_stats(session))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()  # Ensure the session is closed
+
+
+async def compute_stats(session):
+    """Computes the /stats payload from the database."""
+    # Total applications from MASTER_TABLE.
+    stmt_total = select(func.count()).select_from(master_table)
+    total_applications = (await session.execute(stmt_total)).scalar() or 0
+
+    # Count students whose latest iteration status is 'accept', grouped by gender, from LATEST_OFFER.
+    # The outer join keeps accepted students without a MASTER_TABLE row (gender NULL) in the total.
+    stmt_accepted = (
+        select(master_table.c.gender, func.count().label("count"))
+        .select_from(latest_offer_table)
+        .outerjoin(master_table, master_table.c.app_no == latest_offer_table.c.app_no)
+        .where(latest_offer_table.c.status_code.in_(ACCEPT_CODES))
+        .group_by(master_table.c.gender)
+    )
+    accepted_stats = (await session.execute(stmt_accepted)).fetchall()
+
+    accepted_students = sum(count for _, count in accepted_stats)
+    # Convert gender stats to a dictionary
+    gender_dict = {gender: count for gender, count in accepted_stats if gender is not None}
+
+    # Retrieve the latest iteration record (ordered by date descending).
+    stmt_latest = (
+        select(iteration_date_table)
+        .order_by(iteration_date_table.c.date.desc())
+        .limit(1)
+
+    )
+    latest_record = (await session.execute(stmt_latest)).fetchone()
+
+    if latest_record:
+        latest_iteration = latest_record.iteration
+        latest_iteration_date = latest_record.date
+    else:
+        # Defaults: 0 for iteration number and today's date.
+        latest_iteration = 0
+        latest_iteration_date = datetime.now()
+
+    return {
+        "totalApplications": total_applications,
+        "acceptedStudents": accepted_students,  # Count of accepted students
+        "latestIterationNumber": latest_iteration,
+        "latestIterationDate": latest_iteration_date,
+        "genderStats": gender_dict,  # Add gender stats to the response
+    }
 
 @router.get("/fees")
-def get_fees(query: str):
+async def get_fees(query: str, session: AsyncSession = Depends(get_async_session)):
     """
     Returns the fees record for a given application number provided via the query parameter.
 
@@ -135,18 +117,15 @@ def get_fees(query: str):
 
     and returns all these column values.
     """
-    session = SessionLocal()
     try:
         stmt = select(fees_paid_table).where(fees_paid_table.c.app_no == query)
-        # Use .mappings() to get a dictionary-like result.
-        fees_record = session.execute(stmt).mappings().fetchone()
+        result = await session.execute(stmt)
+        fees_record = result.fetchone()
         if not fees_record:
             return {"message": f"No fees record found for application number: {query}"}
-        return jsonable_encoder(fees_record)
+        return FastJSONResponse(records(result.keys(), [fees_record])[0])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
 
 
 def num_there(s):
@@ -154,7 +133,11 @@ def num_there(s):
 
 
 @router.get("/students")
-def get_student(query: str):
+async def get_student(
+    query: str,
+    limit: int = Query(SEARCH_LIMIT, gt=0, le=100),
+    session: AsyncSession = Depends(get_async_session),
+):
     """
     Returns the student record along with iteration offer details for a given application number or student name
     provided via the query parameter.
@@ -163,65 +146,57 @@ def get_student(query: str):
       GET http://localhost:8000/api/students?query=APP001
       GET http://localhost:8000/api/students?query=John%20Doe
 
-    The endpoint queries the master_table and iteration_offer_table:
-      - master_table (app_no, name)
-      - iteration_offer_table (app_no, itr_no, offer, scholarship, status)
-
-    and returns the corresponding student data.
+    Application numbers are matched exactly or by prefix through the MASTER_TABLE primary key; names go
+    through the in-process trigram index (search.py). At most `limit` applicants are returned, best match
+    first, each with their rows from iteration_offer_table (app_no, itr_no, offer, scholarship, status).
     """
-    session = SessionLocal()
     try:
         # Check if query is numeric (for app_no) or string (for name)
         if num_there(query):
-            # If query is a number, search by app_no
-            stmt = (
-                select(
-                    master_table.c.app_no,
-                    master_table.c.name,
-                    iteration_offer_table.c.itr_no,
-                    iteration_offer_table.c.offer,
-                    iteration_offer_table.c.scholarship,
-                    iteration_offer_table.c.status,
-                )
-                .select_from(master_table)
-                .join(
-                    iteration_offer_table, master_table.c.app_no == iteration_offer_table.c.app_no
-                )
-                .where(master_table.c.app_no.ilike(f"%{query}%"))
-            )
+            app_nos = await search_app_nos(session, query.strip(), limit)
         else:
-            # Otherwise, search by name
-            stmt = (
-                select(
-                    master_table.c.app_no,
-                    master_table.c.name,
-                    iteration_offer_table.c.itr_no,
-                    iteration_offer_table.c.offer,
-                    iteration_offer_table.c.scholarship,
-                    iteration_offer_table.c.status,
-                )
-                .select_from(master_table)
-                .join(
-                    iteration_offer_table, master_table.c.app_no == iteration_offer_table.c.app_no
-                )
-                .where(master_table.c.name.ilike(f"%{query}%"))
+            app_nos = await run_in_threadpool(search_names, query, limit)
+
+        if not app_nos:
+            return {"message": f"No student record found for query: {query}"}
+
+        stmt = (
+            select(
+                master_table.c.app_no,
+                master_table.c.name,
+                iteration_offer_table.c.itr_no,
+                iteration_offer_table.c.offer,
+                iteration_offer_table.c.scholarship,
+                iteration_offer_table.c.status,
             )
+            .select_from(master_table)
+            .join(
+                iteration_offer_table, master_table.c.app_no == iteration_offer_table.c.app_no
+            )
+            .where(master_table.c.app_no.in_(app_nos))
+        )
 
-        # Fetch all matching records
-        student_records = session.execute(stmt).mappings().all()
+        # Fetch all matching records, in ranking order
+        rank = {app_no: position for position, app_no in enumerate(app_nos)}
+        result = await session.execute(stmt)
+        names = list(result.keys())
+        rows = sorted(result.all(), key=lambda row: (rank[row.app_no], row.itr_no))
 
-        if not student_records:
+        if not rows:
             return {"message": f"No student record found for query: {query}"}
 
-        return jsonable_encoder(student_records)
+        return FastJSONResponse(records(names, rows))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
 
 
 @router.get("/iterations")
-def get_iteration_details(iteration: int = Query(None, description="Iteration number")):
+async def get_iteration_details(
+    request: Request,
+    iteration: int = Query(None, description="Iteration number"),
+    format: str = Query(None, pattern="^(rows|columns)$", description="columns for the compact columnar payload"),
+    session: AsyncSession = Depends(get_async_session),
+):
     """
     Fetches iteration details for a given iteration number.
 
@@ -230,12 +205,21 @@ def get_iteration_details(iteration: int = Query(None, description="Iteration nu
     - Iteration Number (itr_no)
     - Offer (offer)
     - Status (status)
+
+    With format=columns (or `Accept: application/vnd.iterations.columns+json`) the rows come back
+    column-oriented instead of as one object per row:
+      {"iteration": 1, "count": 3, "appNo": ["APP001", "APP002", "APP003"],
+       "offer": {"values": ["CS", "EEE"], "codes": [0, 1, 0]},
+       "status": {"values": ["accept", "upgrade"], "codes": [0, 0, 1]}}
+    where row i has offer offer.values[offer.codes[i]], and likewise for status.
     """
-    session = SessionLocal()
     try:
         if iteration is None:
             raise HTTPException(status_code=400, detail="Iteration number is required.")
 
+        if format is None:
+            format = "columns" if COLUMNAR_MEDIA_TYPE in request.headers.get("accept", "") else "rows"
+
         # Fetch iteration details from ITERATION_OFFER table
         stmt = select(
             iteration_offer_table.c.app_no,
@@ -244,156 +228,134 @@ def get_iteration_details(iteration: int = Query(None, description="Iteration nu
             iteration_offer_table.c.status,
         ).where(iteration_offer_table.c.itr_no == iteration)
 
-        result = session.execute(stmt).mappings().all()
+        result = await session.execute(stmt)
+        names = list(result.keys())
+        rows = result.all()
 
-        if not result:
+        if not rows:
             return {"message": f"No data found for iteration {iteration}"}
 
-        return jsonable_encoder(result)
+        if format == "columns":
+            app_nos, _, offers, statuses = zip(*rows)
+            content = {
+                "iteration": iteration,
+                "count": len(rows),
+                "appNo": app_nos,
+                "offer": dictionary_encode(offers),
+                "status": dictionary_encode(statuses),
+            }
+            return FastJSONResponse(content, media_type=COLUMNAR_MEDIA_TYPE, headers={"Vary": "Accept"})
+
+        return FastJSONResponse(records(names, rows), headers={"Vary": "Accept"})
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
 
 @router.get("/iteration-count")
-def get_iteration_count():
-    session = SessionLocal()
+async def get_iteration_count(session: AsyncSession = Depends(get_async_session)):
     try:
         stmt = select(func.count()).select_from(iteration_date_table)
-        count = session.execute(stmt).scalar() or 0
+        count = (await session.execute(stmt)).scalar() or 0
         return {"count": count}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
+
+
+def read_withdraw_app_nos(fileobj):
+    """Application numbers of a withdrawal CSV, stripped, with None for blank rows."""
+    # Parsed in chunks so large withdrawal files are never fully loaded into memory
+    app_nos = []
+    for df in read_csv_chunks(fileobj, required_columns=["app_no"]):
+        app_nos.extend(None if pd.isna(app_no) else str(app_no).strip() for app_no in df["app_no"])
+    return app_nos
 
 
 @router.post("/withdraw/upload")
-async def upload_withdraw_csv(file: UploadFile = File(...)):
+async def upload_withdraw_csv(
+    file: UploadFile = File(...), session: AsyncSession = Depends(get_async_session)
+):
     """
     Upload a CSV file containing application numbers that need to be withdrawn.
     - Reads the CSV.
-    - Marks those applications as "withdrawls" in ITERATION_OFFER.
-    - Inserts them into the WITHDRAWS table.
-    - Updates Iteration Details accordingly.
+    - Marks those applications as "withdraw" in their latest ITERATION_OFFER row.
+    - Inserts them into the WITHDRAWS table (withdrawing again refreshes the entry).
+
+    Valid rows are processed even if others are rejected. Returns a per-row report:
+      { "message", "withdrawn": n, "rejected": n,
+        "results": [ { "appNo", "status": "withdrawn", "iteration" } | { "appNo", "status": "rejected", "reason" } ] }
     """
-    session = SessionLocal()
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.BytesIO(contents))
-
-        # Ensure 'app_no' column exists
-        if "app_no" not in df.columns:
-            raise HTTPException(status_code=400, detail="CSV must contain 'app_no' column")
-
-        for row in df.itertuples():
-            app_no = row.app_no
-
-            # Check if the application exists in iteration offer table
-            stmt_check = select(iteration_offer_table.c.app_no).where(
-                iteration_offer_table.c.app_no == app_no
-            )
-            exists = session.execute(stmt_check).scalar()
-
-            if not exists:
-                raise HTTPException(
-                    status_code=404, detail=f"Application {app_no} not found in iteration details."
+        # Parsing is CPU-bound; keep it off the event loop
+        app_nos = await run_in_threadpool(read_withdraw_app_nos, file.file)
+
+        withdrawn = await session.run_sync(withdraw_applicants, [app_no for app_no in app_nos if app_no])
+        await session.commit()
+        invalidate_stats()
+        # Never waits for a running upload; the state is dropped instead while one holds it
+        await run_in_threadpool(iteration_state.apply_withdrawals, list(withdrawn))
+
+        results = []
+        seen = set()
+        for app_no in app_nos:
+            if not app_no:
+                results.append({"appNo": app_no, "status": "rejected", "reason": "Missing application number."})
+            elif app_no in seen:
+                results.append({"appNo": app_no, "status": "rejected", "reason": "Duplicate row."})
+            elif app_no in withdrawn:
+                results.append({"appNo": app_no, "status": "withdrawn", "iteration": withdrawn[app_no]})
+            else:
+                results.append(
+                    {"appNo": app_no, "status": "rejected", "reason": "Application not found in iteration details."}
                 )
+            seen.add(app_no)
 
-            # Update iteration offer status to 'withdrawls'
-            latest_itr_subquery = (
-                select(
-                    iteration_offer_table.c.app_no,
-                    func.max(iteration_offer_table.c.itr_no).label("latest_itr"),
-                )
-                .where(iteration_offer_table.c.app_no == app_no)
-                .group_by(iteration_offer_table.c.app_no)
-                .subquery()
-            )
-
-            stmt_update = (
-                update(iteration_offer_table)
-                .where(
-                    iteration_offer_table.c.app_no == latest_itr_subquery.c.app_no,
-                    iteration_offer_table.c.itr_no == latest_itr_subquery.c.latest_itr,
-                )
-                .values(status="withdraw")
-            )
-            session.execute(stmt_update)
-
-            # Insert withdrawal record
-            stmt_insert = insert(withdraws_table).values(
-                app_no=app_no,
-                date=datetime.now(),
-                uploaded_by="Admin",
-                upload_date_time=datetime.now(),
-            )
-            session.execute(stmt_insert)
-
-        session.commit()
-        return {"message": "Withdrawal list processed successfully."}
+        rejected = len(results) - len(withdrawn)
+        return {
+            "message": f"Withdrew {len(withdrawn)} applications, rejected {rejected} rows.",
+            "withdrawn": len(withdrawn),
+            "rejected": rejected,
+            "results": results,
+        }
 
+    except HTTPException:
+        await session.rollback()
+        raise
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-    finally:
-        session.close()
-
 
 @router.post("/withdraw/student")
-def withdraw_student(request: dict):
+async def withdraw_student(request: dict, session: AsyncSession = Depends(get_async_session)):
     """
     Withdraw a specific student by application number.
     - Expects a JSON request: { "app_no": "APP12345" }
     - Only updates the latest iteration's status in ITERATION_OFFER to 'withdrawls'.
     - Preserves previous iteration statuses.
-    - Adds the student to WITHDRAWS table.
+    - Adds the student to WITHDRAWS table (withdrawing again refreshes the entry, as the CSV upload does).
     """
-    session = SessionLocal()
     try:
         app_no = request.get("app_no")
         if not app_no:
             raise HTTPException(status_code=400, detail="Application Number is required.")
 
-        # Fetch the latest iteration number for the given application number
-        stmt_latest = (
-            select(iteration_offer_table.c.itr_no)
-            .where(iteration_offer_table.c.app_no == app_no)
-            .order_by(iteration_offer_table.c.itr_no.desc())
-            .limit(1)
-        )
-        latest_iteration = session.execute(stmt_latest).scalar()
+        # Update only the latest iteration status to 'withdraw'
+        withdrawn = await session.run_sync(withdraw_applicants, [app_no])
 
-        if latest_iteration is None:
+        if app_no not in withdrawn:
             raise HTTPException(status_code=404, detail="Application not found in iterations.")
+        latest_iteration = withdrawn[app_no]
 
-        # Update only the latest iteration status to 'withdrawls'
-        stmt_update = (
-            update(iteration_offer_table)
-            .where(
-                (iteration_offer_table.c.app_no == app_no)
-                & (iteration_offer_table.c.itr_no == latest_iteration)
-            )
-            .values(status="withdraw")
-        )
-        session.execute(stmt_update)
-
-        # Insert withdrawal record
-        stmt_insert = insert(withdraws_table).values(
-            app_no=app_no, date=datetime.now(), uploaded_by="Admin", upload_date_time=datetime.now()
-        )
-        session.execute(stmt_insert)
-
-        session.commit()
+        await session.commit()
+        invalidate_stats()
+        await run_in_threadpool(iteration_state.apply_withdrawals, [app_no])
         return {
             "message": f"Application {app_no} successfully withdrawn for iteration {latest_iteration}."
         }
 
+    except HTTPException:
+        await session.rollback()
+        raise
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-
-    finally:
-        session.close()
\ No newline at end of file
@@ -0,0 +1,115 @@
+# search.py
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+
+import numpy as np
+from sqlalchemy import select
+
+from db import engine, master_table
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of applicants returned by a search
+SEARCH_LIMIT = int(os.environ.get("SEARCH_LIMIT", 20))
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def trigrams(text: str, prefix: bool = False):
+    """
+    Returns the set of padded trigrams of every word in `text`.
+    With prefix=True the last word is left open at the end, so a partially typed name
+    still matches (e.g. "jo" matches "john").
+    """
+    words = _WORD.findall(text.lower())
+    grams = set()
+    for position, word in enumerate(words):
+        padded = "  " + word if prefix and position == len(words) - 1 else "  " + word + " "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NameIndex:
+    """In-memory trigram index over MASTER_TABLE names, ranked by trigram similarity."""
+
+    def __init__(self, app_nos, names):
+        self.app_nos = app_nos
+        self.names = names
+        postings = defaultdict(list)
+        sizes = np.zeros(len(names), dtype=np.int32)
+        for row, name in enumerate(names):
+            grams = trigrams(name or "")
+            sizes[row] = len(grams)
+            for gram in grams:
+                postings[gram].append(row)
+        self.sizes = sizes
+        self.postings = {gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT):
+        """Returns up to `limit` app_nos whose names share at least half of the query's trigrams, best first."""
+        grams = trigrams(query, prefix=True)
+        hits = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not hits:
+            return []
+
+        counts = np.bincount(np.concatenate(hits), minlength=len(self.names))
+        candidates = np.nonzero(counts * 2 >= len(grams))[0]
+        shared = counts[candidates]
+        # Jaccard similarity between the query's and the name's trigram sets
+        scores = shared / (len(grams) + self.sizes[candidates] - shared)
+        best = candidates[np.argsort(-scores, kind="stable")[:limit]]
+        return [self.app_nos[row] for row in best]
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def rebuild_name_index():
+    """Loads every MASTER_TABLE name and replaces the in-process index."""
+    global _index
+    with engine.connect() as connection:
+        rows = connection.execute(select(master_table.c.app_no, master_table.c.name)).fetchall()
+    index = NameIndex([row.app_no for row in rows], [row.name for row in rows])
+    with _lock:
+        _index = index
+    logger.info("Name search index rebuilt with %d applicants", len(rows))
+    return index
+
+
+def get_name_index():
+    """Returns the name index, building it on first use."""
+    with _lock:
+        index = _index
+    return index if index is not None else rebuild_name_index()
+
+
+def invalidate_name_index():
+    """Drops the index so the next name search rebuilds it; called after MASTER_TABLE uploads."""
+    global _index
+    with _lock:
+        _index = None
+
+
+async def search_app_nos(session, query: str, limit: int = SEARCH_LIMIT):
+    """
+    Exact match first, then prefix matches on app_no, both served by the MASTER_TABLE primary key.
+    """
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    stmt = (
+        select(master_table.c.app_no)
+        .where(master_table.c.app_no.like(f"{escaped}%", escape="\\"))
+        .order_by(master_table.c.app_no)
+        .limit(limit)
+    )
+    matches = list((await session.execute(stmt)).scalars())
+    matches.sort(key=lambda app_no: app_no.lower() != query.lower())
+    return matches
+
+
+def search_names(query: str, limit: int = SEARCH_LIMIT):
+    """Ranked name search through the trigram index. Blocking on first use while the index is built."""
+    return get_name_index().search(query, limit)
@@ -0,0 +1,61 @@
+# serialization.py
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # falls back to the standard library encoder
+    orjson = None
+
+
+def json_default(value):
+    """Encoder fallback for datetimes and decimals, matching jsonable_encoder's output."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    return str(value)
+
+
+def dumps(content) -> bytes:
+    """Serializes to compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default)
+    return json.dumps(content, default=json_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    """
+    JSONResponse that skips jsonable_encoder: the content must already be plain dicts, lists and
+    scalars (datetimes are encoded natively). Use records() or columns() to get there from rows.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def records(names, rows):
+    """Rows as a list of {name: value} dicts. Extra trailing columns of each row are dropped."""
+    names = [str(name) for name in names]  # orjson rejects str subclasses such as quoted_name as keys
+    return [dict(zip(names, row)) for row in rows]
+
+
+def columns(names, rows):
+    """Column-oriented payload: the names once, then one array of values per row."""
+    width = len(names)
+    return {"columns": [str(name) for name in names], "rows": [tuple(row)[:width] for row in rows]}
+
+
+def dictionary_encode(values):
+    """
+    Dictionary-encodes a column: {"values": distinct values in first-seen order, "codes": index of each
+    value in "values"}. Worth it for low-cardinality columns such as offer and status.
+    """
+    index = {}
+    codes = [index.setdefault(value, len(index)) for value in values]
+    return {"values": list(index), "codes": codes}
@@ -0,0 +1,48 @@
+# stats_cache.py
+import asyncio
+import os
+import threading
+import time
+
+# Seconds a cached /api/stats result is served before it is recomputed, even without writes.
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", 300))
+
+_lock = threading.Lock()
+_refresh_lock = asyncio.Lock()
+_stats = None
+_expires_at = 0.0
+_generation = 0
+
+
+async def get_cached_stats(compute):
+    """
+    Returns the cached dashboard stats, awaiting `compute()` to rebuild them when the cache
+    has been invalidated or is older than STATS_CACHE_TTL.
+    Concurrent readers of a cold cache wait for a single recomputation.
+    """
+    global _stats, _expires_at
+    async with _refresh_lock:
+        with _lock:
+            if _stats is not None and time.monotonic() < _expires_at:
+                return _stats
+            generation = _generation
+
+        stats = await compute()
+
+        with _lock:
+            # An upload that finished while computing has already made this result stale
+            if generation == _generation:
+                _stats = stats
+                _expires_at = time.monotonic() + STATS_CACHE_TTL
+        return stats
+
+
+def invalidate_stats():
+    """
+    Drops the cached stats; called by every endpoint that changes offers, statuses or applicants.
+    Safe to call from the upload worker threads.
+    """
+    global _stats, _generation
+    with _lock:
+        _stats = None
+        _generation += 1
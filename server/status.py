@@ -0,0 +1,232 @@
+# status.py
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from sqlalchemy import case, select, update
+
+from bulk import UPLOAD_CHUNK_SIZE
+from db import (
+    fees_paid_table,
+    iteration_date_table,
+    iteration_offer_table,
+    latest_offer_table,
+    upsert,
+    withdraws_table,
+)
+
+# Status values written to ITERATION_OFFER (see flow.txt)
+ACCEPT = "accept"
+ACCEPT_UPGRADED = "accept & upgraded"
+UPGRADE = "upgrade"
+WITHDRAW = "withdraw"
+
+# Indexed small-integer mirror of the status column (status_code); anything else, including NULL, is 0
+STATUS_CODES = {ACCEPT: 1, ACCEPT_UPGRADED: 2, UPGRADE: 3, WITHDRAW: 4}
+OTHER_STATUS_CODE = 0
+ACCEPT_CODES = (STATUS_CODES[ACCEPT], STATUS_CODES[ACCEPT_UPGRADED])
+
+WAITLIST_OFFER = "WL"
+
+
+def get_latest_iteration(connection):
+    """Returns the most recently uploaded iteration number from ITERATION_DATE, or None."""
+    return connection.execute(
+        select(iteration_date_table.c.iteration)
+        .order_by(iteration_date_table.c.date.desc())
+        .limit(1)
+    ).scalar()
+
+
+def status_codes(statuses: pd.Series):
+    """Maps a Series of status strings to their status codes."""
+    return statuses.map(STATUS_CODES).fillna(OTHER_STATUS_CODE).astype(int)
+
+
+def status_code_case(column):
+    """SQL expression computing the status code of a status column."""
+    return case(STATUS_CODES, value=column, else_=OTHER_STATUS_CODE)
+
+
+def fetch_offer_history(connection, app_nos):
+    """
+    Returns the latest two ITERATION_OFFER rows of every given app_no as one row per app_no:
+      - itr_no, offer, status: the latest iteration
+      - prev_offer, prev_status, prev_status_code: the iteration before it (NaN if there is none)
+
+    Read with primary-key lookups on LATEST_OFFER instead of one query per student.
+    """
+    stmt = select(
+        latest_offer_table.c.app_no,
+        latest_offer_table.c.itr_no,
+        latest_offer_table.c.offer,
+        latest_offer_table.c.status,
+        latest_offer_table.c.prev_offer,
+        latest_offer_table.c.prev_status,
+        latest_offer_table.c.prev_status_code,
+    ).where(latest_offer_table.c.app_no.in_(list(dict.fromkeys(app_nos))))
+    rows = connection.execute(stmt).fetchall()
+    return pd.DataFrame(
+        rows, columns=["app_no", "itr_no", "offer", "status", "prev_offer", "prev_status", "prev_status_code"]
+    ).set_index("app_no")
+
+
+def fetch_changed_paid_offers(connection, app_nos=None):
+    """
+    Returns, in one join, the students who have paid both fees and whose latest offer differs
+    from the offer of their previous iteration: the only rows an ITERATION_OFFER upload can
+    move to "accept & upgraded". Restricted to the given app_nos when provided.
+    """
+    stmt = (
+        select(
+            latest_offer_table.c.app_no,
+            latest_offer_table.c.itr_no,
+            latest_offer_table.c.offer,
+            latest_offer_table.c.status,
+            latest_offer_table.c.prev_offer,
+            latest_offer_table.c.prev_status,
+            latest_offer_table.c.prev_status_code,
+        )
+        .join(fees_paid_table, fees_paid_table.c.app_no == latest_offer_table.c.app_no)
+        .where(
+            latest_offer_table.c.prev_offer.is_not(None),
+            latest_offer_table.c.offer != latest_offer_table.c.prev_offer,
+            fees_paid_table.c.admission_fees_status != 0,
+            fees_paid_table.c.tution_fees_status != 0,
+        )
+    )
+    if app_nos is not None:
+        stmt = stmt.where(latest_offer_table.c.app_no.in_(list(dict.fromkeys(app_nos))))
+    rows = connection.execute(stmt).fetchall()
+    return pd.DataFrame(
+        rows, columns=["app_no", "itr_no", "offer", "status", "prev_offer", "prev_status", "prev_status_code"]
+    ).set_index("app_no")
+
+
+def is_upgraded(history: pd.DataFrame):
+    """True where the offer changed from the previous iteration and the previous status was an accept."""
+    return (
+        history["prev_offer"].notna()
+        & (history["offer"] != history["prev_offer"])
+        & history["prev_status_code"].isin(ACCEPT_CODES)
+    )
+
+
+def classify_fees(fees: pd.DataFrame, history: pd.DataFrame, latest_iteration):
+    """
+    Applies the fee rules from flow.txt to every row of an uploaded FEES_PAID frame at once:
+      - admission and tuition paid: "accept & upgraded" if the offer was upgraded, otherwise "accept"
+      - only admission paid: "upgrade" if the latest offer is a waitlist, otherwise "withdraw"
+      - anything else: "withdraw"
+
+    Returns a Series of statuses indexed by app_no.
+    """
+    fees = fees.drop_duplicates("app_no", keep="last").set_index("app_no")
+    history = history.reindex(fees.index)
+
+    admission_paid = fees["admission_fees_status"].fillna(0).astype(bool)
+    tuition_paid = fees["tution_fees_status"].fillna(0).astype(bool)
+    latest_is_waitlist = (history["itr_no"] == latest_iteration) & (history["offer"] == WAITLIST_OFFER)
+
+    statuses = np.select(
+        [
+            admission_paid & tuition_paid & is_upgraded(history),
+            admission_paid & tuition_paid,
+            admission_paid & latest_is_waitlist,
+        ],
+        [ACCEPT_UPGRADED, ACCEPT, UPGRADE],
+        default=WITHDRAW,
+    )
+    return pd.Series(statuses, index=fees.index, name="status")
+
+
+def write_statuses(connection, statuses: pd.Series, iteration, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Writes app_no -> status for the given iteration with one
+    UPDATE ... SET status = CASE app_no ... END per chunk, and mirrors it into LATEST_OFFER.
+    """
+    for start in range(0, len(statuses), chunk_size):
+        chunk = statuses.iloc[start:start + chunk_size]
+        app_nos = list(chunk.index)
+        mapping = chunk.to_dict()
+        codes = status_codes(chunk).to_dict()
+        connection.execute(
+            update(iteration_offer_table)
+            .where(
+                iteration_offer_table.c.itr_no == iteration,
+                iteration_offer_table.c.app_no.in_(app_nos),
+            )
+            .values(
+                status=case(mapping, value=iteration_offer_table.c.app_no),
+                status_code=case(codes, value=iteration_offer_table.c.app_no),
+            )
+        )
+        connection.execute(
+            update(latest_offer_table)
+            .where(latest_offer_table.c.itr_no == iteration, latest_offer_table.c.app_no.in_(app_nos))
+            .values(
+                status=case(mapping, value=latest_offer_table.c.app_no),
+                status_code=case(codes, value=latest_offer_table.c.app_no),
+            )
+        )
+        connection.execute(
+            update(latest_offer_table)
+            .where(latest_offer_table.c.prev_itr_no == iteration, latest_offer_table.c.app_no.in_(app_nos))
+            .values(
+                prev_status=case(mapping, value=latest_offer_table.c.app_no),
+                prev_status_code=case(codes, value=latest_offer_table.c.app_no),
+            )
+        )
+
+
+def withdraw_applicants(connection, app_nos, uploaded_by: str = "Admin", chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Sets "withdraw" on the latest iteration of each of `app_nos`, in ITERATION_OFFER and LATEST_OFFER,
+    and records them in WITHDRAWS. Per chunk:
+      - one IN query on LATEST_OFFER finds which applicants exist and their latest iteration,
+      - one joined UPDATE sets "withdraw" on those ITERATION_OFFER rows, one UPDATE mirrors it in LATEST_OFFER,
+      - one multi-row upsert records them in WITHDRAWS (re-withdrawing refreshes the dates).
+    Returns {app_no: latest iteration} for the applicants found; the others were left untouched.
+    """
+    withdrawn = {}
+    app_nos = list(dict.fromkeys(app_nos))
+    for start in range(0, len(app_nos), chunk_size):
+        chunk = app_nos[start:start + chunk_size]
+        found = dict(
+            connection.execute(
+                select(latest_offer_table.c.app_no, latest_offer_table.c.itr_no).where(
+                    latest_offer_table.c.app_no.in_(chunk)
+                )
+            ).all()
+        )
+        if not found:
+            continue
+
+        ids = list(found)
+        connection.execute(
+            update(iteration_offer_table)
+            .where(
+                iteration_offer_table.c.app_no == latest_offer_table.c.app_no,
+                iteration_offer_table.c.itr_no == latest_offer_table.c.itr_no,
+                latest_offer_table.c.app_no.in_(ids),
+            )
+            .values(status=WITHDRAW, status_code=STATUS_CODES[WITHDRAW])
+        )
+        connection.execute(
+            update(latest_offer_table)
+            .where(latest_offer_table.c.app_no.in_(ids))
+            .values(status=WITHDRAW, status_code=STATUS_CODES[WITHDRAW])
+        )
+
+        now = datetime.now()
+        stmt = upsert(withdraws_table).values(
+            [{"app_no": app_no, "date": now, "uploaded_by": uploaded_by, "upload_date_time": now} for app_no in ids]
+        )
+        stmt = stmt.on_duplicate_key_update(
+            date=stmt.inserted.date,
+            uploaded_by=stmt.inserted.uploaded_by,
+            upload_date_time=stmt.inserted.upload_date_time,
+        )
+        connection.execute(stmt)
+        withdrawn.update(found)
+    return withdrawn
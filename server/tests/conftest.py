@@ -0,0 +1,59 @@
+# conftest.py
+"""
+Request-level tests run the app against a throwaway SQLite database: db.py reads DATABASE_URL when it
+is imported, so it is set here before any server module is loaded.
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+import types
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+TEST_DIR = tempfile.mkdtemp(prefix="admissions-tests-")
+# SQLite has one writer: an upload job's progress writes wait on its transaction, and are skipped
+# after this timeout (as any failed progress write is) instead of the default five seconds
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}?timeout=0.1"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(TEST_DIR, 'test.db')}"
+os.environ["UPLOAD_SPOOL_DIR"] = os.path.join(TEST_DIR, "upload_spool")
+os.environ["ITERATION_STATE"] = "false"
+
+# The SendGrid key file is deployment configuration and is not checked in
+if importlib.util.find_spec("api_key") is None:
+    sys.modules["api_key"] = types.SimpleNamespace(SENDGRID_API_KEY="")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import auth  # noqa: E402
+from db import engine, metadata, user_table  # noqa: E402
+from main import app  # noqa: E402
+
+TEST_USER = {"name": "Test Admin", "contact": "0", "campus": "Pilani", "email": "admin@example.com", "role": "admin"}
+
+
+@pytest.fixture(autouse=True)
+def empty_database():
+    """Every test starts from empty tables."""
+    with engine.begin() as connection:
+        for table in reversed(metadata.sorted_tables):
+            connection.execute(table.delete())
+    yield
+
+
+@pytest.fixture
+def client():
+    """A client without a login token. Startup hooks (migrations, workers) are not run."""
+    return TestClient(app)
+
+
+@pytest.fixture
+def auth_client(client):
+    """A client logged in as an admin user."""
+    with engine.begin() as connection:
+        connection.execute(user_table.insert().values(hashed_password="unused", **TEST_USER))
+    client.cookies.set("token", auth.create_access_token({"sub": TEST_USER["email"], "role": TEST_USER["role"]}))
+    return client
@@ -0,0 +1,38 @@
+# test_data_routes.py
+from db import engine, master_table
+
+STUDENTS = [
+    {"app_no": "APP00001", "name": "Aditi Rao", "gender": "Female"},
+    {"app_no": "APP00002", "name": "Rohan Shah", "gender": "Male"},
+]
+
+
+def add_students():
+    with engine.begin() as connection:
+        connection.execute(master_table.insert(), STUDENTS)
+
+
+def test_read_data_columns_format(client):
+    add_students()
+    response = client.get("/data/MASTER_TABLE", params={"format": "columns"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["columns"] == ["app_no", "name", "gender"]
+    assert sorted(body["rows"]) == [[row["app_no"], row["name"], row["gender"]] for row in STUDENTS]
+
+
+def test_read_data_columns_format_with_projection(client):
+    add_students()
+    response = client.get("/data/MASTER_TABLE", params={"format": "columns", "columns": "name", "limit": 1})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["columns"] == ["name"]
+    assert body["rows"] == [["Aditi Rao"]]
+    assert body["nextCursor"] is not None
+
+
+def test_internal_tables_are_not_served(auth_client):
+    for table_name in ("UPLOAD_JOBS", "SCHEMA_MIGRATIONS", "LATEST_OFFER", "USERS"):
+        assert auth_client.get(f"/data/{table_name}").status_code == 400
+        response = auth_client.post(f"/update/{table_name}", files={"file": ("upload.csv", b"job_id\nx\n", "text/csv")})
+        assert response.status_code == 400
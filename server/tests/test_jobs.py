@@ -0,0 +1,35 @@
+# test_jobs.py
+import jobs
+
+MASTER_CSV = b"app_no,name,gender\nAPP00001,Aditi Rao,Female\nAPP00002,Rohan Shah,Male\n"
+
+
+def queue_upload(auth_client, monkeypatch, table_name, content):
+    """POSTs the upload with the worker paused; returns the response and the queued job ids."""
+    queued = []
+    monkeypatch.setattr(jobs.executor, "submit", lambda run, job_id: queued.append(job_id))
+    response = auth_client.post(f"/update/{table_name}", files={"file": ("upload.csv", content, "text/csv")})
+    return response, queued
+
+
+def test_finished_job_reports_ingest_summary(auth_client, monkeypatch):
+    response, queued = queue_upload(auth_client, monkeypatch, "MASTER_TABLE", MASTER_CSV)
+    assert response.status_code == 202
+    assert queued == [response.json()["jobId"]]
+
+    queued_job = auth_client.get(f"/jobs/{queued[0]}").json()
+    assert queued_job["phase"] == "queued"
+    assert queued_job["rowsPerSecond"] is None
+
+    jobs.run_job(queued[0])
+    job = auth_client.get(f"/jobs/{queued[0]}").json()
+    assert job["phase"] == "done"
+    assert job["rowsIngested"] == 2
+    assert job["rowsPerSecond"] > 0
+    assert job["statusCounts"] == {}
+
+
+def test_upload_with_missing_columns_is_rejected_before_queueing(auth_client, monkeypatch):
+    response, queued = queue_upload(auth_client, monkeypatch, "MASTER_TABLE", b"app_no\nAPP00001\n")
+    assert response.status_code == 400
+    assert queued == []
@@ -0,0 +1,38 @@
+# test_withdraw_routes.py
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from db import engine, iteration_offer_table, latest_offer_table, withdraws_table
+
+
+def add_offer(app_no, itr_no=1, status="upgrade"):
+    with engine.begin() as connection:
+        connection.execute(
+            iteration_offer_table.insert().values(
+                app_no=app_no, itr_no=itr_no, offer="Pilani CS", uploaded_by="Pilani Admin",
+                upload_datetime=datetime(2025, 1, 2, 9, 0), status=status,
+            )
+        )
+        connection.execute(
+            latest_offer_table.insert().values(app_no=app_no, itr_no=itr_no, offer="Pilani CS", status=status)
+        )
+
+
+def test_withdraw_student_twice_is_idempotent(client):
+    add_offer("APP00001")
+    for _ in range(2):
+        response = client.post("/api/withdraw/student", json={"app_no": "APP00001"})
+        assert response.status_code == 200
+
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(withdraws_table)).scalar() == 1
+        status = connection.execute(
+            select(iteration_offer_table.c.status).where(iteration_offer_table.c.app_no == "APP00001")
+        ).scalar()
+    assert status == "withdraw"
+
+
+def test_withdraw_unknown_student(client):
+    assert client.post("/api/withdraw/student", json={"app_no": "APP99999"}).status_code == 404
+    assert client.post("/api/withdraw/student", json={}).status_code == 400